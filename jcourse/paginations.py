@@ -1,6 +1,106 @@
+import base64
+import datetime
+import json
+
+from django.db import models
+from django.db.models import F, Q
+from django.utils.dateparse import parse_datetime
+from rest_framework.exceptions import NotFound
 from rest_framework.pagination import PageNumberPagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
 
 
 class GlobalPageNumberPagination(PageNumberPagination):
     max_page_size = 100
     page_size_query_param = 'size'
+
+
+class KeysetPagination(GlobalPageNumberPagination):
+    """
+    请求带 cursor 参数时按 (排序键..., id) 降序做 keyset 翻页，不做 COUNT 也没有 OFFSET，否则按页码翻页。
+    视图通过 get_keyset_ordering() 返回 [(别名, 表达式), ...]，表达式不能为空值，返回 None 时不启用。
+    """
+    cursor_query_param = 'cursor'
+    invalid_cursor_message = 'Invalid cursor'
+
+    def paginate_queryset(self, queryset, request, view=None):
+        get_keyset_ordering = getattr(view, 'get_keyset_ordering', None)
+        self.keyset = get_keyset_ordering() if get_keyset_ordering else None
+        if self.cursor_query_param not in request.query_params or self.keyset is None:
+            self.keyset = None
+            return super().paginate_queryset(queryset, request, view)
+
+        self.request = request
+        page_size = self.get_page_size(request)
+        keys = [name for name, _ in self.keyset] + ['id']
+        queryset = queryset.annotate(**dict(self.keyset)).order_by(*[F(key).desc() for key in keys])
+        cursor = self.decode_cursor(request, [get_key_type(queryset, key) for key in keys])
+        if cursor is not None:
+            queryset = queryset.filter(build_keyset_condition(keys, cursor))
+        results = list(queryset[:page_size + 1])
+        self.next_cursor = None
+        if len(results) > page_size:
+            results = results[:page_size]
+            self.next_cursor = [getattr(results[-1], key) for key in keys]
+        return results
+
+    def decode_cursor(self, request, key_types: list[type]):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if not encoded:
+            return None
+        try:
+            cursor = json.loads(base64.urlsafe_b64decode(encoded.encode('ascii')))
+            if not isinstance(cursor, list) or len(cursor) != len(key_types):
+                raise ValueError
+            # 每个位置的值必须与对应排序键的类型一致，时间以字符串形式保存
+            cursor = [parse_datetime(value) if key_type is datetime.datetime and isinstance(value, str) else value
+                      for value, key_type in zip(cursor, key_types)]
+            for value, key_type in zip(cursor, key_types):
+                if not isinstance(value, key_type) or isinstance(value, bool):
+                    raise ValueError
+                if key_type is int and not -2 ** 63 <= value < 2 ** 63:
+                    raise ValueError
+        except (TypeError, ValueError):
+            raise NotFound(self.invalid_cursor_message)
+        return cursor
+
+    @staticmethod
+    def encode_cursor(cursor: list) -> str:
+        # 保留完整的微秒，DjangoJSONEncoder 会截断到毫秒
+        cursor = [value.isoformat() if isinstance(value, datetime.datetime) else value for value in cursor]
+        return base64.urlsafe_b64encode(json.dumps(cursor).encode('ascii')).decode('ascii')
+
+    def get_next_link(self):
+        if self.keyset is None:
+            return super().get_next_link()
+        if self.next_cursor is None:
+            return None
+        url = self.request.build_absolute_uri()
+        return replace_query_param(url, self.cursor_query_param, self.encode_cursor(self.next_cursor))
+
+    def get_paginated_response(self, data):
+        if self.keyset is None:
+            return super().get_paginated_response(data)
+        return Response({
+            'next': self.get_next_link(),
+            'results': data,
+        })
+
+
+def build_keyset_condition(keys: list[str], values: list) -> Q:
+    # (k1, k2, ..., kn) < (v1, v2, ..., vn)
+    condition = Q(**{f'{keys[-1]}__lt': values[-1]})
+    for key, value in zip(reversed(keys[:-1]), reversed(values[:-1])):
+        condition = Q(**{f'{key}__lt': value}) | (Q(**{key: value}) & condition)
+    # 冗余的首列范围条件，让数据库可以直接从索引的游标位置开始扫描
+    return Q(**{f'{keys[0]}__lte': values[0]}) & condition
+
+
+def get_key_type(queryset, key: str) -> type:
+    # 排序键只有时间和整数两种
+    if key in queryset.query.annotations:
+        field = queryset.query.annotations[key].output_field
+    else:
+        field = queryset.model._meta.get_field(key)
+    return datetime.datetime if isinstance(field, models.DateTimeField) else int
@@ -1,4 +1,9 @@
-from rest_framework.renderers import BrowsableAPIRenderer
+from rest_framework.renderers import BrowsableAPIRenderer, JSONRenderer
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
 
 
 class BrowsableAPIRendererWithoutForms(BrowsableAPIRenderer):
@@ -18,3 +23,29 @@ class BrowsableAPIRendererWithoutForms(BrowsableAPIRenderer):
         rendered HTML, so let's simply return an empty string.
         """
         return ""
+
+
+class FastJSONRenderer(JSONRenderer):
+    """
+    使用 orjson 渲染紧凑的 UTF-8 JSON，除极大/极小浮点数的写法（1e16、0.00001）和 NaN（输出 null）外与 JSONRenderer 相同。
+    orjson 不支持的类型（Decimal、时间、QuerySet、惰性字符串等）交给 DRF 的 JSONEncoder 转换；
+    未安装 orjson、需要缩进、关闭了 UNICODE_JSON/COMPACT_JSON 或 orjson 无法编码（超大整数、非字符串键）时退回 JSONRenderer。
+    """
+    # 时间交给 JSONEncoder，与 JSONRenderer 一样用 Z 表示 UTC
+    options = orjson.OPT_PASSTHROUGH_DATETIME if orjson is not None else 0
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        renderer_context = renderer_context or {}
+        if orjson is None or self.ensure_ascii or not self.compact or \
+                self.get_indent(accepted_media_type, renderer_context) is not None:
+            return super().render(data, accepted_media_type, renderer_context)
+        try:
+            ret = orjson.dumps(data, default=self.encoder_class().default, option=self.options)
+        except orjson.JSONEncodeError:
+            return super().render(data, accepted_media_type, renderer_context)
+        # 与 JSONRenderer 一致，转义 JavaScript 中不合法的 U+2028、U+2029
+        if b'\xe2\x80\xa8' in ret or b'\xe2\x80\xa9' in ret:
+            ret = ret.replace(b'\xe2\x80\xa8', b'\\u2028').replace(b'\xe2\x80\xa9', b'\\u2029')
+        return ret
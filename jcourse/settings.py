@@ -173,7 +173,7 @@ REST_FRAMEWORK = {
     'PAGE_SIZE': 20,
     'DATETIME_FORMAT': "%Y/%m/%d %H:%M",
     'DEFAULT_RENDERER_CLASSES': (
-        'rest_framework.renderers.JSONRenderer',
+        'jcourse.renderers.FastJSONRenderer',
     ),
     'UPLOADED_FILES_USE_URL': False
 }
@@ -191,7 +191,7 @@ if not BENCHMARK:
 
 if DEBUG:
     REST_FRAMEWORK['DEFAULT_RENDERER_CLASSES'] = (
-        'rest_framework.renderers.JSONRenderer',
+        'jcourse.renderers.FastJSONRenderer',
         'jcourse.renderers.BrowsableAPIRendererWithoutForms',
     )
 
@@ -300,6 +300,11 @@ EMAIL_VERIFICATION_TIMEOUT = int(os.environ.get('EMAIL_VERIFICATION_TIMEOUT', 10
 EMAIL_VERIFICATION_MAX_TIMES = int(os.environ.get('EMAIL_VERIFICATION_MAX_TIMES', 3))
 
 REVIEW_READ_ONLY = bool(os.environ.get("REVIEW_READ_ONLY", False))
+# 发布点评时 5 分钟内最多发布的点评数，设为 0 时不限制
+REVIEW_RATE_LIMIT = int(os.environ.get("REVIEW_RATE_LIMIT", 5))
+
+# 预先生成的 jieba 词典缓存文件，为空时在系统临时目录下生成 jieba.cache
+JIEBA_CACHE_FILE = os.environ.get('JIEBA_CACHE_FILE', '')
 
 AUTH_PASSWORD_VALIDATORS = [
     {
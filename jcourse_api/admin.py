@@ -6,6 +6,8 @@ from import_export.admin import ImportExportModelAdmin
 from import_export.widgets import ForeignKeyWidget, ManyToManyWidget
 
 from jcourse_api.models import *
+from jcourse_api.repository import invalidate_former_code_map, invalidate_unread_notification_count, \
+    invalidate_course_filter
 
 
 class CourseResource(resources.ModelResource):
@@ -19,7 +21,7 @@ class CourseResource(resources.ModelResource):
     class Meta:
         model = Course
         import_id_fields = ('code', 'main_teacher')
-        exclude = ('id', 'review_count', 'review_avg')
+        exclude = ('id', 'review_count', 'review_avg', 'review_rating_sum')
         skip_unchanged = True
         report_skipped = False
         export_order = (
@@ -31,6 +33,10 @@ class CourseResource(resources.ModelResource):
         except IntegrityError:
             pass
 
+    def after_import(self, dataset, result, **kwargs):
+        super().after_import(dataset, result, **kwargs)
+        invalidate_course_filter()
+
 
 @admin.register(Course)
 class CourseAdmin(ImportExportModelAdmin):
@@ -41,7 +47,7 @@ class CourseAdmin(ImportExportModelAdmin):
     search_fields = ('id', 'code', 'name')
     autocomplete_fields = ('main_teacher', 'teacher_group', 'department', 'categories')
     resource_class = CourseResource
-    readonly_fields = ('review_count', 'review_avg')
+    readonly_fields = ('review_count', 'review_avg', 'review_rating_sum')
 
 
 class TeacherResource(resources.ModelResource):
@@ -94,6 +100,11 @@ class FormerCodeResource(resources.ModelResource):
         except IntegrityError:
             pass
 
+    def after_import(self, dataset, result, **kwargs):
+        # use_bulk 不触发信号
+        super().after_import(dataset, result, **kwargs)
+        invalidate_former_code_map()
+
 
 @admin.register(FormerCode)
 class FormerCodeAdmin(ImportExportModelAdmin):
@@ -231,10 +242,12 @@ class NotificationAdmin(ImportExportModelAdmin):
     @admin.action(description='设为已读')
     def mark_as_read(self, request, queryset):
         queryset.update(read_at=timezone.now())
+        invalidate_unread_notification_count(queryset.values_list('recipient_id', flat=True))
 
     @admin.action(description='设为未读')
     def mark_as_unread(self, request, queryset):
         queryset.update(read_at=None)
+        invalidate_unread_notification_count(queryset.values_list('recipient_id', flat=True))
 
 
 @admin.register(CourseNotificationLevel)
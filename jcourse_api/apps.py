@@ -1,6 +1,5 @@
-import jieba
 from django.apps import AppConfig
-from django.db.models.signals import post_delete, post_save
+from django.db.models.signals import post_delete, post_save, m2m_changed
 
 
 class JcourseApiConfig(AppConfig):
@@ -9,12 +8,42 @@ class JcourseApiConfig(AppConfig):
     verbose_name = '选课社区'
 
     def ready(self):
-        jieba.initialize()
-
-        from jcourse_api.models import ReviewReaction, Review, Report
+        from ad.models import Promotion
+        from jcourse_api.models import ReviewReaction, Review, Report, Course, Teacher, FormerCode, \
+            CourseNotificationLevel, Semester, UserPoint, Announcement, EnrollCourse, Notification, Category, Department
         from jcourse_api.signals import signal_delete_review_actions, \
-            signal_delete_course_reviews, signal_notify_report_replied
+            signal_delete_course_reviews, signal_notify_report_replied, \
+            signal_refresh_course_suggest, signal_refresh_teacher_course_suggest, signal_invalidate_former_code_map, \
+            signal_invalidate_notification_level, signal_invalidate_review_filter, \
+            signal_invalidate_user_point, signal_invalidate_common_info, signal_invalidate_user_common_info, \
+            signal_invalidate_unread_notification_count, signal_invalidate_course_related, \
+            signal_invalidate_course_filter
         post_delete.connect(signal_delete_review_actions, sender=ReviewReaction)
         post_delete.connect(signal_delete_course_reviews, sender=Review)
         post_save.connect(signal_notify_report_replied, sender=Report)
-        # post_save.connect(signal_notify_new_review_generated, sender=Review)
+        post_save.connect(signal_refresh_course_suggest, sender=Course)
+        post_delete.connect(signal_refresh_course_suggest, sender=Course)
+        post_save.connect(signal_refresh_teacher_course_suggest, sender=Teacher)
+        post_save.connect(signal_invalidate_former_code_map, sender=FormerCode)
+        post_delete.connect(signal_invalidate_former_code_map, sender=FormerCode)
+        post_save.connect(signal_invalidate_notification_level, sender=CourseNotificationLevel)
+        post_delete.connect(signal_invalidate_notification_level, sender=CourseNotificationLevel)
+        post_save.connect(signal_invalidate_review_filter, sender=Semester)
+        post_delete.connect(signal_invalidate_review_filter, sender=Semester)
+        post_save.connect(signal_invalidate_user_point, sender=UserPoint)
+        post_delete.connect(signal_invalidate_user_point, sender=UserPoint)
+        for sender in (Announcement, Semester, Promotion):
+            post_save.connect(signal_invalidate_common_info, sender=sender)
+            post_delete.connect(signal_invalidate_common_info, sender=sender)
+        for sender in (Review, EnrollCourse):
+            post_save.connect(signal_invalidate_user_common_info, sender=sender)
+            post_delete.connect(signal_invalidate_user_common_info, sender=sender)
+        post_save.connect(signal_invalidate_unread_notification_count, sender=Notification)
+        post_delete.connect(signal_invalidate_unread_notification_count, sender=Notification)
+        for sender in (Course, Teacher):
+            post_save.connect(signal_invalidate_course_related, sender=sender)
+            post_delete.connect(signal_invalidate_course_related, sender=sender)
+        for sender in (Course, Category, Department):
+            post_save.connect(signal_invalidate_course_filter, sender=sender)
+            post_delete.connect(signal_invalidate_course_filter, sender=sender)
+        m2m_changed.connect(signal_invalidate_course_filter, sender=Course.categories.through)
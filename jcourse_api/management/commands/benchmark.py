@@ -0,0 +1,213 @@
+import random
+import statistics
+import subprocess
+import sys
+
+from django.apps import apps
+from django.contrib.auth.models import AnonymousUser, User
+from django.core.management import BaseCommand, CommandError
+from django.db import transaction, connection
+from django.test.utils import override_settings
+from django.utils import timezone
+from rest_framework.renderers import JSONRenderer
+from rest_framework.test import APIRequestFactory, force_authenticate
+
+from jcourse.renderers import FastJSONRenderer
+from jcourse_api.models import Course, Review, CourseNotificationLevel, Semester
+from jcourse_api.repository import get_search_course_queryset, get_course_list_queryset, get_reviews, \
+    get_daily_statistics
+from jcourse_api.serializers import CourseListSerializer, ReviewListSerializer, ReviewInCourseSerializer, \
+    attach_my_reactions
+from jcourse_api.utils.benchmark import measure, format_measure
+from jcourse_api.views import ReviewViewSet
+
+SEARCH_QUERIES = ['CS', 'MATH1', '高等数学', '程序设计', 'zhang', 'ZW', '物理', 'EE0']
+
+
+def scale_courses(scale: int):
+    # 复制现有课程到 scale 倍，课号加后缀以满足唯一约束
+    courses = list(Course.objects.all())
+    for i in range(1, scale):
+        Course.objects.bulk_create([Course(code=f'{course.code}-{i}', name=course.name,
+                                           department_id=course.department_id, credit=course.credit,
+                                           main_teacher_id=course.main_teacher_id) for course in courses],
+                                   batch_size=1000)
+    analyze()
+
+
+def analyze():
+    with connection.cursor() as cursor:
+        cursor.execute('ANALYZE')
+
+
+def create_reviews(count: int):
+    # 每条点评对应一个新用户，避免 (user, course) 唯一约束冲突
+    course_ids = list(Course.objects.values_list('id', flat=True))
+    semester = Semester.objects.first() or Semester.objects.create(name='benchmark')
+    users = User.objects.bulk_create([User(username=f'benchmark_{i}') for i in range(count)], batch_size=1000)
+    now = timezone.now()
+    Review.objects.bulk_create([Review(user=user, course_id=random.choice(course_ids), rating=random.randint(1, 5),
+                                       semester=semester, comment='benchmark', created_at=now - timezone.timedelta(minutes=i),
+                                       modified_at=now - timezone.timedelta(minutes=i))
+                                for i, user in enumerate(users)], batch_size=1000)
+    analyze()
+
+
+def benchmark_feed(command: BaseCommand, options):
+    if options['reviews'] > 0:
+        create_reviews(options['reviews'])
+    command.stdout.write(f'reviews: {Review.objects.count()}')
+    view = ReviewViewSet.as_view({'get': 'list'}, throttle_classes=[])
+    factory = APIRequestFactory()
+    plain_user = User.objects.create(username='benchmark_plain')
+    ignore_user = User.objects.create(username='benchmark_ignore')
+    course_ids = list(Review.objects.order_by().values_list('course_id', flat=True).distinct()[:options['ignores']])
+    CourseNotificationLevel.objects.bulk_create([
+        CourseNotificationLevel(user=ignore_user, course_id=course_id,
+                                notification_level=CourseNotificationLevel.NotificationLevelType.IGNORE)
+        for course_id in course_ids])
+    for name, user, params in [('no ignores', plain_user, {}), (f'{len(course_ids)} ignores', ignore_user, {}),
+                               ('no ignores, page 50', plain_user, {'page': 50}),
+                               (f'{len(course_ids)} ignores, page 50', ignore_user, {'page': 50})]:
+        def request():
+            req = factory.get('/api/review/', params)
+            force_authenticate(req, user=user)
+            response = view(req).render()
+            if response.status_code != 200:
+                raise CommandError(f'feed returned {response.status_code}: {response.content[:200]}')
+
+        # APIRequestFactory 使用 testserver 作为 Host
+        with override_settings(ALLOWED_HOSTS=['testserver']):
+            command.stdout.write(format_measure(f'feed {name}', measure(request, options['times'])))
+
+
+def benchmark_search(command: BaseCommand, options):
+    user = AnonymousUser()
+    queries = options['query'] or SEARCH_QUERIES
+    command.stdout.write(f'courses: {Course.objects.count()}')
+    for q in queries:
+        result = measure(lambda: list(get_search_course_queryset(q, user)[:20]), options['times'])
+        command.stdout.write(format_measure(f'search {q}', result))
+
+
+SERIALIZER_PAGE_SIZE = 100
+
+
+def benchmark_serializers(command: BaseCommand, options):
+    # 只比较内存中一页数据的序列化，不含查询；两条路径输出必须一致
+    if options['reviews'] > 0:
+        create_reviews(options['reviews'])
+    user = User.objects.create(username='benchmark_serializer')
+    request = APIRequestFactory().get('/')
+    request.user = user
+    context = {'request': request}
+    courses = list(get_course_list_queryset(user)[:SERIALIZER_PAGE_SIZE])
+    reviews = list(get_reviews(user).order_by('-modified_at')[:SERIALIZER_PAGE_SIZE])
+    attach_my_reactions(reviews, user)
+    renderer = JSONRenderer()
+    for name, serializer_class, items in [('course', CourseListSerializer, courses),
+                                          ('review', ReviewListSerializer, reviews),
+                                          ('review in course', ReviewInCourseSerializer, reviews)]:
+        child = serializer_class(context=context)
+        slow = lambda: [child.to_representation(item) for item in items]
+        fast = lambda: [child.fast_representation(item) for item in items]
+        if renderer.render(slow()) != renderer.render(fast()):
+            raise CommandError(f'{name} fast representation differs')
+        for path, func in [('drf', slow), ('fast', fast)]:
+            result = measure(func, options['times'])
+            rows = len(items) / result['mean'] * 1000 if result['mean'] > 0 else 0
+            command.stdout.write(f"{format_measure(f'{name} {path} x{len(items)}', result)} {rows:.0f} rows/s")
+
+
+def benchmark_renderer(command: BaseCommand, options):
+    # 渲染已经序列化好的响应数据，比较每个响应节省的时间
+    if options['reviews'] > 0:
+        create_reviews(options['reviews'])
+    user = User.objects.create(username='benchmark_renderer')
+    request = APIRequestFactory().get('/')
+    request.user = user
+    context = {'request': request}
+    courses = CourseListSerializer(get_course_list_queryset(user)[:SERIALIZER_PAGE_SIZE], many=True,
+                                   context=context).data
+    reviews = ReviewListSerializer(get_reviews(user).order_by('-modified_at')[:SERIALIZER_PAGE_SIZE], many=True,
+                                   context=context).data
+    # StatisticView 中 date 对象的时间序列
+    statistic = [{'date': statistic.date, 'count': statistic.review_count} for statistic in get_daily_statistics()]
+    renderers = [('json', JSONRenderer()), ('fast', FastJSONRenderer())]
+    for name, data in [(f'course x{len(courses)}', courses), (f'review x{len(reviews)}', reviews),
+                       ('statistic', statistic)]:
+        if renderers[0][1].render(data) != renderers[1][1].render(data):
+            command.stdout.write(f'{name}: rendered bytes differ')
+        results = {}
+        for path, renderer in renderers:
+            results[path] = measure(lambda: renderer.render(data), options['times'])
+            command.stdout.write(format_measure(f'{name} {path}', results[path]))
+        saved = results['json']['mean'] - results['fast']['mean']
+        command.stdout.write(f"{name}: {len(renderers[0][1].render(data))} bytes, saved {saved:.3f}ms per response")
+
+
+STARTUP_RUNS = 3
+# 相当于 worker 启动后处理第一个请求之前的工作：初始化 Django 并加载全部 URL（视图）
+STARTUP_SCRIPT = 'import sys, time; start = time.perf_counter(); import django; django.setup(); ' \
+                 'from django.urls import get_resolver; get_resolver().url_patterns; ' \
+                 'print(time.perf_counter() - start, "jieba" in sys.modules)'
+
+
+def parse_import_time(stderr: str, app_names: list[str]) -> dict[str, float]:
+    # -X importtime 的输出：import time: self [us] | cumulative | 缩进的模块名，顶层导入计入所属的 app
+    costs = {}
+    for line in stderr.splitlines():
+        if not line.startswith('import time:') or line.endswith('imported package'):
+            continue
+        _, cumulative, name = line[len('import time:'):].split('|')
+        if name.startswith('  '):
+            continue
+        name = name.strip()
+        app = max((app_name for app_name in app_names if name == app_name or name.startswith(app_name + '.')),
+                  key=len, default='other')
+        costs[app] = costs.get(app, 0) + int(cumulative) / 1000
+    return costs
+
+
+def benchmark_startup(command: BaseCommand, options):
+    # 在新进程中测量，当前进程已经完成了初始化
+    # Django 本身单独列出，其余不属于任何 app 的顶层导入（标准库、项目包等）计入 other
+    app_names = [app_config.name for app_config in apps.get_app_configs()] + ['django']
+    totals, costs = [], {}
+    for _ in range(STARTUP_RUNS):
+        result = subprocess.run([sys.executable, '-X', 'importtime', '-c', STARTUP_SCRIPT], capture_output=True,
+                                text=True)
+        if result.returncode != 0:
+            raise CommandError(f'startup failed: {result.stderr[-500:]}')
+        total, jieba_loaded = result.stdout.split()[-2:]
+        totals.append(float(total) * 1000)
+        for app, cost in parse_import_time(result.stderr, app_names).items():
+            costs.setdefault(app, []).append(cost)
+    for app, cost in sorted(costs.items(), key=lambda item: -statistics.median(item[1])):
+        command.stdout.write(f'import {app}: {statistics.median(cost):.1f}ms')
+    command.stdout.write(f'startup total: {statistics.median(totals):.1f}ms, jieba loaded: {jieba_loaded}')
+
+
+TARGETS = {'search': benchmark_search, 'feed': benchmark_feed, 'serializers': benchmark_serializers,
+           'renderer': benchmark_renderer, 'startup': benchmark_startup}
+
+
+class Command(BaseCommand):
+    help = 'Benchmark hot paths, all data changes are rolled back'
+
+    def add_arguments(self, parser):
+        parser.add_argument('target', type=str, choices=TARGETS.keys())
+        parser.add_argument('--scale', type=int, default=1, help='scale courses to N times before benchmark')
+        parser.add_argument('--times', type=int, default=100)
+        parser.add_argument('-q', '--query', type=str, action='append', help='search keyword, can be repeated')
+        parser.add_argument('--reviews', type=int, default=0, help='create N extra reviews before benchmark')
+        parser.add_argument('--ignores', type=int, default=20, help='number of ignored courses for feed')
+
+    def handle(self, *args, **options):
+        if options['scale'] < 1:
+            raise CommandError('scale must be positive')
+        with transaction.atomic():
+            if options['scale'] > 1:
+                scale_courses(options['scale'])
+            TARGETS[options['target']](self, options)
+            transaction.set_rollback(True)
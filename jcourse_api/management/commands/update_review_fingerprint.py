@@ -0,0 +1,33 @@
+from django.core.management import BaseCommand
+
+from jcourse_api.models import Review, ReviewFingerprint
+
+
+class Command(BaseCommand):
+    help = 'Build the near-duplicate fingerprints of reviews in batches'
+
+    def add_arguments(self, parser):
+        parser.add_argument('-b', '--batch-size', type=int, default=500, help='reviews per batch')
+        parser.add_argument('-a', '--all', action="store_true", help='rebuild all reviews, not only missing ones')
+
+    def handle(self, *args, **options):
+        reviews = Review.objects.only('id', 'comment', 'created_at').order_by('id')
+        if options['all']:
+            ReviewFingerprint.objects.all().delete()
+        else:
+            reviews = reviews.filter(fingerprint__isnull=True)
+        batch_size = options['batch_size']
+        last_id = 0
+        total = 0
+        while True:
+            batch = list(reviews.filter(id__gt=last_id)[:batch_size])
+            if not batch:
+                break
+            # 与 huey 任务并发时以已有的为准
+            ReviewFingerprint.objects.bulk_create(
+                [ReviewFingerprint.from_comment(review.id, review.comment, review.created_at) for review in batch],
+                ignore_conflicts=True)
+            last_id = batch[-1].id
+            total += len(batch)
+            self.stdout.write(f'Updated: {total}')
+        self.stdout.write(f'Result: {total} reviews updated')
@@ -0,0 +1,34 @@
+from django.core.management import BaseCommand
+
+from jcourse_api.models import Review
+from utils.cut_word import get_cut_words_search_vectors
+
+
+class Command(BaseCommand):
+    help = 'Backfill search vectors of reviews in batches'
+
+    def add_arguments(self, parser):
+        parser.add_argument('-b', '--batch-size', type=int, default=500, help='reviews per batch')
+        parser.add_argument('-a', '--all', action="store_true", help='rebuild all reviews, not only missing ones')
+        parser.add_argument('-p', '--processes', type=int, default=1, help='number of processes for segmentation')
+
+    def handle(self, *args, **options):
+        reviews = Review.objects.only('id', 'comment').order_by('id')
+        if not options['all']:
+            reviews = reviews.filter(search_vector__isnull=True)
+        batch_size = options['batch_size']
+        last_id = 0
+        total = 0
+        while True:
+            # 按 id 翻页，避免更新后 search_vector__isnull 条件导致 offset 错位
+            batch = list(reviews.filter(id__gt=last_id)[:batch_size])
+            if not batch:
+                break
+            search_vectors = get_cut_words_search_vectors([review.comment for review in batch], options['processes'])
+            for review, search_vector in zip(batch, search_vectors):
+                review.search_vector = search_vector
+            Review.objects.bulk_update(batch, ['search_vector'])
+            last_id = batch[-1].id
+            total += len(batch)
+            self.stdout.write(f'Updated: {total}')
+        self.stdout.write(f'Result: {total} reviews updated')
@@ -3,6 +3,8 @@ import csv
 from django.core.management import BaseCommand
 
 from jcourse_api.models import *
+from jcourse_api.repository import get_former_code_map, get_course_code_aliases, invalidate_course_filter, \
+    pick_course_by_code_aliases
 
 
 class Command(BaseCommand):
@@ -17,16 +19,18 @@ class Command(BaseCommand):
 
     def update_course(self, filename: str, semester_name: str):
         semester = Semester.objects.get(name=semester_name)
+        former_codes = get_former_code_map()
         with open(filename, mode='r') as f:
             reader = csv.DictReader(f)
             for row in reader:
-                course = Course.objects.filter(last_semester=None, code=row['code'],
-                                               main_teacher__tid=row['main_teacher'])
-                if course.exists():
-                    course = course.get()
+                codes = get_course_code_aliases(row['code'], former_codes)
+                course = pick_course_by_code_aliases(
+                    Course.objects.filter(code__in=codes, main_teacher__tid=row['main_teacher']), codes)
+                if course is not None and course.last_semester is None:
                     course.last_semester = semester
                     print(course)
                     course.save()
+        invalidate_course_filter()
 
     def update_teacher(self, filename: str, semester_name: str):
         semester = Semester.objects.get(name=semester_name)
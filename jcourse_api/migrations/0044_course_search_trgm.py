@@ -0,0 +1,37 @@
+# Generated by Django 6.0.3 on 2026-10-18 12:07
+
+import django.contrib.postgres.indexes
+from django.contrib.postgres.operations import TrigramExtension
+import django.db.models.functions.text
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('jcourse_api', '0043_alter_reviewrevision_review'),
+    ]
+
+    operations = [
+        TrigramExtension(),
+        migrations.AddIndex(
+            model_name='course',
+            index=django.contrib.postgres.indexes.GinIndex(django.contrib.postgres.indexes.OpClass(django.db.models.functions.text.Upper('code'), name='gin_trgm_ops'), name='course_code_trgm'),
+        ),
+        migrations.AddIndex(
+            model_name='course',
+            index=django.contrib.postgres.indexes.GinIndex(django.contrib.postgres.indexes.OpClass(django.db.models.functions.text.Upper('name'), name='gin_trgm_ops'), name='course_name_trgm'),
+        ),
+        migrations.AddIndex(
+            model_name='teacher',
+            index=django.contrib.postgres.indexes.GinIndex(django.contrib.postgres.indexes.OpClass(django.db.models.functions.text.Upper('name'), name='gin_trgm_ops'), name='teacher_name_trgm'),
+        ),
+        migrations.AddIndex(
+            model_name='teacher',
+            index=django.contrib.postgres.indexes.GinIndex(django.contrib.postgres.indexes.OpClass(django.db.models.functions.text.Upper('pinyin'), name='gin_trgm_ops'), name='teacher_pinyin_trgm'),
+        ),
+        migrations.AddIndex(
+            model_name='teacher',
+            index=django.contrib.postgres.indexes.GinIndex(django.contrib.postgres.indexes.OpClass(django.db.models.functions.text.Upper('abbr_pinyin'), name='gin_trgm_ops'), name='teacher_abbr_pinyin_trgm'),
+        ),
+    ]
@@ -0,0 +1,24 @@
+# Generated by Django 6.0.3 on 2026-10-18 12:16
+
+import django.db.models.functions.comparison
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('jcourse_api', '0044_course_search_trgm'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='review',
+            index=models.Index(models.OrderBy(django.db.models.functions.comparison.Coalesce('modified_at', 'created_at'), descending=True), models.OrderBy(models.F('id'), descending=True), name='review_feed_modified_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='review',
+            index=models.Index(models.OrderBy(django.db.models.functions.comparison.Coalesce('approve_count', models.Value(0)), descending=True), models.OrderBy(models.F('created_at'), descending=True), models.OrderBy(models.F('id'), descending=True), name='review_feed_approves_idx'),
+        ),
+    ]
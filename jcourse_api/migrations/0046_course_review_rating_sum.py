@@ -0,0 +1,29 @@
+# Generated by Django 6.0.3 on 2026-10-18 12:40
+
+from django.db import migrations, models
+from django.db.models import OuterRef, Subquery, Sum, Value
+from django.db.models.functions import Coalesce
+
+
+def fill_review_rating_sum(apps, schema_editor):
+    Course = apps.get_model('jcourse_api', 'Course')
+    Review = apps.get_model('jcourse_api', 'Review')
+    rating_sum = Review.objects.filter(course=OuterRef('pk')).order_by().values('course') \
+        .annotate(sum=Sum('rating')).values('sum')
+    Course.objects.update(review_rating_sum=Coalesce(Subquery(rating_sum), Value(0)))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('jcourse_api', '0045_review_feed_keyset'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='course',
+            name='review_rating_sum',
+            field=models.IntegerField(default=0, verbose_name='评分总和'),
+        ),
+        migrations.RunPython(fill_review_rating_sum, reverse_code=migrations.RunPython.noop),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 6.0.3 on 2026-10-18 13:10
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('jcourse_api', '0046_course_review_rating_sum'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DailyStatistic',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField(unique=True, verbose_name='日期')),
+                ('user_count', models.IntegerField(default=0, verbose_name='新用户数')),
+                ('review_count', models.IntegerField(default=0, verbose_name='新点评数')),
+                ('review_rating_counts', models.JSONField(default=dict, verbose_name='新点评推荐指数分布')),
+            ],
+            options={
+                'verbose_name': '每日统计',
+                'verbose_name_plural': '每日统计',
+                'ordering': ['date'],
+            },
+        ),
+    ]
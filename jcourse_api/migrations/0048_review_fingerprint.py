@@ -0,0 +1,32 @@
+# Generated by Django 6.0.3 on 2026-10-18 13:40
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('jcourse_api', '0047_daily_statistic'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ReviewFingerprint',
+            fields=[
+                ('review', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='fingerprint', serialize=False, to='jcourse_api.review', verbose_name='点评')),
+                ('simhash', models.BigIntegerField(verbose_name='SimHash')),
+                ('token_count', models.IntegerField(verbose_name='词数')),
+                ('band0', models.IntegerField()),
+                ('band1', models.IntegerField()),
+                ('band2', models.IntegerField()),
+                ('band3', models.IntegerField()),
+                ('created_at', models.DateTimeField(verbose_name='发布时间')),
+            ],
+            options={
+                'verbose_name': '点评指纹',
+                'verbose_name_plural': '点评指纹',
+                'indexes': [models.Index(fields=['band0', 'created_at'], name='review_fingerprint_band0_idx'), models.Index(fields=['band1', 'created_at'], name='review_fingerprint_band1_idx'), models.Index(fields=['band2', 'created_at'], name='review_fingerprint_band2_idx'), models.Index(fields=['band3', 'created_at'], name='review_fingerprint_band3_idx')],
+            },
+        ),
+    ]
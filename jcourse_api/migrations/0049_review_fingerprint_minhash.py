@@ -0,0 +1,87 @@
+# Generated by Django 6.0.3 on 2026-10-18 21:40
+
+from django.db import migrations, models
+
+
+def delete_fingerprints(apps, schema_editor):
+    # 旧的 SimHash 分段无法转换，迁移后用 update_review_fingerprint 重建
+    apps.get_model('jcourse_api', 'ReviewFingerprint').objects.all().delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('jcourse_api', '0048_review_fingerprint'),
+    ]
+
+    operations = [
+        migrations.RunPython(delete_fingerprints, migrations.RunPython.noop),
+        migrations.RemoveField(
+            model_name='reviewfingerprint',
+            name='simhash',
+        ),
+        migrations.RemoveField(
+            model_name='reviewfingerprint',
+            name='token_count',
+        ),
+        migrations.AddField(
+            model_name='reviewfingerprint',
+            name='band4',
+            field=models.IntegerField(default=0),
+            preserve_default=False,
+        ),
+        migrations.AddField(
+            model_name='reviewfingerprint',
+            name='band5',
+            field=models.IntegerField(default=0),
+            preserve_default=False,
+        ),
+        migrations.AddField(
+            model_name='reviewfingerprint',
+            name='band6',
+            field=models.IntegerField(default=0),
+            preserve_default=False,
+        ),
+        migrations.AddField(
+            model_name='reviewfingerprint',
+            name='band7',
+            field=models.IntegerField(default=0),
+            preserve_default=False,
+        ),
+        migrations.AddField(
+            model_name='reviewfingerprint',
+            name='band8',
+            field=models.IntegerField(default=0),
+            preserve_default=False,
+        ),
+        migrations.AddField(
+            model_name='reviewfingerprint',
+            name='band9',
+            field=models.IntegerField(default=0),
+            preserve_default=False,
+        ),
+        migrations.AddIndex(
+            model_name='reviewfingerprint',
+            index=models.Index(fields=['band4', 'created_at'], name='review_fingerprint_band4_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='reviewfingerprint',
+            index=models.Index(fields=['band5', 'created_at'], name='review_fingerprint_band5_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='reviewfingerprint',
+            index=models.Index(fields=['band6', 'created_at'], name='review_fingerprint_band6_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='reviewfingerprint',
+            index=models.Index(fields=['band7', 'created_at'], name='review_fingerprint_band7_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='reviewfingerprint',
+            index=models.Index(fields=['band8', 'created_at'], name='review_fingerprint_band8_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='reviewfingerprint',
+            index=models.Index(fields=['band9', 'created_at'], name='review_fingerprint_band9_idx'),
+        ),
+    ]
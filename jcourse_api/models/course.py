@@ -1,4 +1,6 @@
+from django.contrib.postgres.indexes import GinIndex, OpClass
 from django.db import models
+from django.db.models.functions import Upper
 
 from jcourse_api.models import Department, Semester
 
@@ -35,6 +37,10 @@ class Teacher(models.Model):
         verbose_name_plural = verbose_name
         ordering = ['name']
         constraints = [models.UniqueConstraint(fields=['tid', 'name'], name='unique_teacher')]
+        # 搜索使用 icontains/iexact（即 UPPER(...) LIKE），用 pg_trgm 表达式索引加速
+        indexes = [GinIndex(OpClass(Upper('name'), name='gin_trgm_ops'), name='teacher_name_trgm'),
+                   GinIndex(OpClass(Upper('pinyin'), name='gin_trgm_ops'), name='teacher_pinyin_trgm'),
+                   GinIndex(OpClass(Upper('abbr_pinyin'), name='gin_trgm_ops'), name='teacher_abbr_pinyin_trgm')]
 
     tid = models.CharField(verbose_name='工号', max_length=32, null=True, blank=True, unique=True)
     name = models.CharField(verbose_name='姓名', max_length=255, db_index=True)
@@ -56,6 +62,8 @@ class Course(models.Model):
         verbose_name_plural = verbose_name
         ordering = ['code']
         constraints = [models.UniqueConstraint(fields=['code', 'main_teacher'], name='unique_course')]
+        indexes = [GinIndex(OpClass(Upper('code'), name='gin_trgm_ops'), name='course_code_trgm'),
+                   GinIndex(OpClass(Upper('name'), name='gin_trgm_ops'), name='course_name_trgm')]
 
     code = models.CharField(verbose_name='课号', max_length=32, db_index=True)
     name = models.CharField(verbose_name='名称', max_length=255, db_index=True)
@@ -68,6 +76,8 @@ class Course(models.Model):
     moderator_remark = models.TextField(verbose_name='管理员批注', null=True, blank=True, max_length=817)
     review_count = models.IntegerField(verbose_name='点评数', null=True, blank=True, default=0, db_index=True)
     review_avg = models.FloatField(verbose_name='平均评分', null=True, blank=True, default=0, db_index=True)
+    # 评分总和，用于增量维护 review_avg
+    review_rating_sum = models.IntegerField(verbose_name='评分总和', default=0)
     # 仅用于后台维护，不对外显示
     last_semester = models.ForeignKey(Semester, verbose_name='最后更新学期', null=True, blank=True,
                                       on_delete=models.SET_NULL)
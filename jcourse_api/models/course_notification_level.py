@@ -1,9 +1,10 @@
 from django.contrib.auth.models import User
+from django.contrib.contenttypes.models import ContentType
 from django.db import models
 from django.db.models import UniqueConstraint
 from django.utils import timezone
 
-from jcourse_api.models import Course, send_course_new_review_notification
+from jcourse_api.models import Course, Notification, Review, send_course_new_review_notifications
 
 
 class CourseNotificationLevel(models.Model):
@@ -27,9 +28,21 @@ class CourseNotificationLevel(models.Model):
         return f"{self.user}-{self.get_notification_level_display()}-{self.course}"
 
 
-def find_course_new_review(course: Course):
-    for course_notification_level in CourseNotificationLevel.objects.filter(
-            course=course,
-            notification_level=CourseNotificationLevel.NotificationLevelType.FOLLOW
-    ):
-        send_course_new_review_notification(course_notification_level.user, course)
+def find_course_new_review(course_id: int, since_review_id: int) -> int:
+    # 只针对 since_review_id 及之后的新点评，只有自己写的点评时不通知自己
+    author_ids = set(Review.objects.filter(course_id=course_id, id__gte=since_review_id)
+                     .values_list('user_id', flat=True))
+    if not author_ids:
+        return 0
+    # 已有该课程未读的新点评通知的关注者不再重复通知
+    unread = Notification.objects.filter(type=Notification.NotificationType.COURSES_NEW_REVIEW,
+                                         content_type=ContentType.objects.get_for_model(Course),
+                                         object_id=course_id, read_at__isnull=True).values('recipient_id')
+    recipient_ids = CourseNotificationLevel.objects.filter(
+        course_id=course_id,
+        notification_level=CourseNotificationLevel.NotificationLevelType.FOLLOW
+    ).exclude(user_id__in=unread)
+    if len(author_ids) == 1:
+        recipient_ids = recipient_ids.exclude(user_id__in=author_ids)
+    recipient_ids = recipient_ids.values_list('user_id', flat=True)
+    return send_course_new_review_notifications(recipient_ids.iterator(chunk_size=1000), course_id)
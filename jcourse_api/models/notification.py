@@ -2,7 +2,7 @@ from django.contrib import admin
 from django.contrib.auth.models import User
 from django.contrib.contenttypes.fields import GenericForeignKey
 from django.contrib.contenttypes.models import ContentType
-from django.db import models
+from django.db import models, transaction
 from django.utils import timezone
 
 from jcourse_api.models import Report, Course
@@ -60,11 +60,29 @@ def send_report_replied_notification(report: Report):
         )
 
 
-def send_course_new_review_notification(user: User, course: Course):
-    Notification.objects.create(
-        recipient=user,
-        type=Notification.NotificationType.COURSES_NEW_REVIEW,
-        content_type=ContentType.objects.get_for_model(course),
-        object_id=course.id,
-        created_at=timezone.now()
-    )
+def send_course_new_review_notifications(recipient_ids, course_id: int, batch_size: int = 1000) -> int:
+    # 关注者较多时分批插入，返回发出的通知数
+    from jcourse_api.repository import invalidate_unread_notification_count
+    content_type = ContentType.objects.get_for_model(Course)
+    created_at = timezone.now()
+    notifications = []
+    count = 0
+
+    def flush():
+        Notification.objects.bulk_create(notifications)
+        # bulk_create 不触发信号
+        user_ids = [notification.recipient_id for notification in notifications]
+        transaction.on_commit(lambda: invalidate_unread_notification_count(user_ids))
+
+    for recipient_id in recipient_ids:
+        notifications.append(Notification(recipient_id=recipient_id,
+                                          type=Notification.NotificationType.COURSES_NEW_REVIEW,
+                                          content_type=content_type, object_id=course_id, created_at=created_at))
+        if len(notifications) >= batch_size:
+            flush()
+            count += len(notifications)
+            notifications = []
+    if notifications:
+        flush()
+        count += len(notifications)
+    return count
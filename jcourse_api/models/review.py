@@ -2,12 +2,12 @@ from django.contrib.auth.models import User
 from django.contrib.postgres.indexes import GinIndex
 from django.contrib.postgres.search import SearchVectorField
 from django.core.validators import MaxValueValidator, MinValueValidator
-from django.db import models
-from django.db.models import Count, Avg, Q
+from django.db import models, transaction
+from django.db.models import Count, Avg, Q, F, Value, Sum
+from django.db.models.functions import Coalesce, Cast, NullIf
 from django.utils import timezone
 
 from jcourse_api.models import constrain_text, Course, Semester
-from utils.cut_word import get_cut_word_search_vector
 
 
 class Review(models.Model):
@@ -16,7 +16,12 @@ class Review(models.Model):
         verbose_name_plural = verbose_name
         ordering = ['-modified_at']
         constraints = [models.UniqueConstraint(fields=['user', 'course'], name='unique_review')]
-        indexes = [GinIndex(fields=['search_vector'])]
+        indexes = [GinIndex(fields=['search_vector']),
+                   # 点评列表 keyset 翻页使用
+                   models.Index(Coalesce('modified_at', 'created_at').desc(), F('id').desc(),
+                                name='review_feed_modified_idx'),
+                   models.Index(Coalesce('approve_count', Value(0)).desc(), F('created_at').desc(), F('id').desc(),
+                                name='review_feed_approves_idx')]
 
     user = models.ForeignKey(User, verbose_name='用户', on_delete=models.CASCADE, db_index=True)
     course = models.ForeignKey(Course, verbose_name='课程', on_delete=models.CASCADE, db_index=True)
@@ -39,23 +44,86 @@ class Review(models.Model):
 
     comment_validity.short_description = '详细点评'
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._remember_loaded_values()
+        return instance
+
+    def _remember_loaded_values(self):
+        # 记录从数据库读出时的值，保存时据此计算增量，不必再查一次旧记录
+        self._loaded_values = {field: self.__dict__.get(field) for field in ('course_id', 'rating', 'comment')}
+
+    def _get_previous_values(self):
+        loaded_values = getattr(self, '_loaded_values', None)
+        if loaded_values is None or None in loaded_values.values():
+            return Review.objects.filter(pk=self.pk).values('course_id', 'rating', 'comment').first()
+        return loaded_values
+
     def save(self, *, force_insert=False, force_update=False, using=None, update_fields=None):
-        need_to_update = False
-        old_course = None
-        if self.pk is None:
-            need_to_update = True
-        else:
-            previous = Review.objects.get(pk=self.pk)
-            if previous.course_id != self.course_id or previous.rating != self.rating:
-                need_to_update = True
-                old_course = previous.course
-            if previous.comment != self.comment:
-                self.search_vector = get_cut_word_search_vector(self.comment)
+        previous = None
+        tracked_fields = {'course', 'course_id', 'rating', 'comment'}
+        if self.pk is not None and (update_fields is None or tracked_fields & set(update_fields)):
+            previous = self._get_previous_values()
+        # 手动指定 pk 新建时数据库中没有旧记录
+        created = self.pk is None or (previous is None and update_fields is None)
         super().save(force_insert=force_insert, force_update=force_update, using=using, update_fields=update_fields)
-        if need_to_update:
-            update_course_reviews(self.course)
-            if old_course and old_course != self.course:
-                update_course_reviews(old_course)
+        need_to_index = created
+        if created:
+            add_course_review(self.course_id, self.rating, 1)
+        elif previous is not None:
+            if previous['course_id'] != self.course_id:
+                add_course_review(previous['course_id'], -previous['rating'], -1)
+                add_course_review(self.course_id, self.rating, 1)
+            elif previous['rating'] != self.rating:
+                add_course_review(self.course_id, self.rating - previous['rating'], 0)
+            need_to_index = previous['comment'] != self.comment
+        self._remember_loaded_values()
+        if update_fields is None or {'course', 'course_id', 'semester', 'semester_id', 'rating'} & set(update_fields):
+            from jcourse_api.repository import invalidate_review_filter
+            course_ids = {self.course_id}
+            if previous is not None:
+                course_ids.add(previous['course_id'])
+            transaction.on_commit(lambda: invalidate_review_filter(course_ids))
+        if need_to_index:
+            # 分词较慢，提交后交给 huey 异步更新 search_vector
+            from jcourse_api.tasks import update_review_search_vector
+            review_id = self.pk
+            transaction.on_commit(lambda: update_review_search_vector(review_id))
+            from jcourse_api.tasks import update_review_fingerprint
+            transaction.on_commit(lambda: update_review_fingerprint(review_id))
+
+
+class ReviewFingerprint(models.Model):
+    """
+    点评内容的 MinHash，分为 10 段，每段与发布时间建联合索引，用于召回近期的近似重复点评。
+    """
+
+    class Meta:
+        verbose_name = '点评指纹'
+        verbose_name_plural = verbose_name
+        indexes = [models.Index(fields=[f'band{i}', 'created_at'], name=f'review_fingerprint_band{i}_idx')
+                   for i in range(10)]
+
+    review = models.OneToOneField(Review, verbose_name='点评', on_delete=models.CASCADE, primary_key=True,
+                                  related_name='fingerprint')
+    band0 = models.IntegerField()
+    band1 = models.IntegerField()
+    band2 = models.IntegerField()
+    band3 = models.IntegerField()
+    band4 = models.IntegerField()
+    band5 = models.IntegerField()
+    band6 = models.IntegerField()
+    band7 = models.IntegerField()
+    band8 = models.IntegerField()
+    band9 = models.IntegerField()
+    created_at = models.DateTimeField(verbose_name='发布时间')
+
+    @staticmethod
+    def from_comment(review_id: int, comment: str, created_at) -> 'ReviewFingerprint':
+        from utils.minhash import text_bands
+        return ReviewFingerprint(review_id=review_id, created_at=created_at,
+                                 **{f'band{i}': band for i, band in enumerate(text_bands(comment))})
 
 
 class ReviewRevision(models.Model):
@@ -98,21 +166,51 @@ class ReviewReaction(models.Model):
     def __str__(self):
         return f"{self.user} {self.get_reaction_display()} {self.review.id}"
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._remember_loaded_values()
+        return instance
+
+    def _remember_loaded_values(self):
+        self._loaded_values = {field: self.__dict__.get(field) for field in ('review_id', 'reaction')}
+
+    def _get_previous_values(self):
+        loaded_values = getattr(self, '_loaded_values', None)
+        if loaded_values is None or None in loaded_values.values():
+            return ReviewReaction.objects.filter(pk=self.pk).values('review_id', 'reaction').first()
+        return loaded_values
+
     def save(self, *, force_insert=False, force_update=False, using=None, update_fields=None):
-        need_to_update = False
-        old_review = None
-        if self.pk is None:
-            need_to_update = True
-        else:
-            previous = ReviewReaction.objects.get(pk=self.pk)
-            if previous.review_id != self.review_id or previous.reaction != self.reaction:
-                need_to_update = True
-                old_review = previous.review
+        previous = None
+        tracked_fields = {'review', 'review_id', 'reaction'}
+        if self.pk is not None and (update_fields is None or tracked_fields & set(update_fields)):
+            previous = self._get_previous_values()
+        created = self.pk is None or (previous is None and update_fields is None)
         super().save(force_insert=force_insert, force_update=force_update, using=using, update_fields=update_fields)
-        if need_to_update:
-            update_review_reactions(self.review)
-            if old_review and old_review != self.review:
-                update_review_reactions(old_review)
+        reaction = int(self.reaction)
+        if created:
+            add_review_reaction(self.review_id, ReviewReaction.ReactionType.RESET, reaction)
+        elif previous is not None:
+            if previous['review_id'] != self.review_id:
+                add_review_reaction(previous['review_id'], previous['reaction'], ReviewReaction.ReactionType.RESET)
+                add_review_reaction(self.review_id, ReviewReaction.ReactionType.RESET, reaction)
+            else:
+                add_review_reaction(self.review_id, previous['reaction'], reaction)
+        self._remember_loaded_values()
+
+
+def add_review_reaction(review_id: int, old_reaction: int, new_reaction: int):
+    # 用 F() 原子增减计数，并发点击时不会丢失更新
+    approve_delta = int(new_reaction == ReviewReaction.ReactionType.APPROVE) - \
+                    int(old_reaction == ReviewReaction.ReactionType.APPROVE)
+    disapprove_delta = int(new_reaction == ReviewReaction.ReactionType.DISAPPROVE) - \
+                       int(old_reaction == ReviewReaction.ReactionType.DISAPPROVE)
+    if approve_delta == 0 and disapprove_delta == 0:
+        return
+    Review.objects.filter(pk=review_id).update(
+        approve_count=Coalesce('approve_count', Value(0)) + approve_delta,
+        disapprove_count=Coalesce('disapprove_count', Value(0)) + disapprove_delta)
 
 
 def update_review_reactions(review: Review):
@@ -124,8 +222,78 @@ def update_review_reactions(review: Review):
     review.save(update_fields=['approve_count', 'disapprove_count'])
 
 
+def add_course_review(course_id: int, rating_delta: int, count_delta: int):
+    # UPDATE 右侧的 F() 取的是旧值，新的平均分需要带上增量计算
+    rating_sum = F('review_rating_sum') + rating_delta
+    count = F('review_count') + count_delta
+    Course.objects.filter(pk=course_id).update(
+        review_rating_sum=rating_sum, review_count=count,
+        review_avg=Cast(rating_sum, output_field=models.FloatField()) / NullIf(count, Value(0)))
+    # 相关课程、相关教师中展示了推荐指数
+    from jcourse_api.repository import invalidate_course_related
+    transaction.on_commit(lambda: invalidate_course_related([course_id]))
+
+
 def update_course_reviews(course: Course):
-    review = Review.objects.filter(course=course).aggregate(avg=Avg('rating'), count=Count('*'))
+    review = Review.objects.filter(course=course).aggregate(avg=Avg('rating'), count=Count('*'), sum=Sum('rating'))
     course.review_count = review['count']
     course.review_avg = review['avg']
-    course.save(update_fields=['review_count', 'review_avg'])
+    course.review_rating_sum = review['sum'] or 0
+    course.save(update_fields=['review_count', 'review_avg', 'review_rating_sum'])
+
+
+def reconcile_course_reviews() -> int:
+    # 修正增量维护可能产生的偏差，返回被修正的课程数
+    stats = {row['course_id']: (row['count'], row['sum']) for row in
+             Review.objects.order_by().values('course_id').annotate(count=Count('*'), sum=Sum('rating'))}
+    drifted = []
+    for course in Course.objects.only('id', 'review_count', 'review_avg', 'review_rating_sum').iterator():
+        count, rating_sum = stats.get(course.id, (0, 0))
+        avg = rating_sum / count if count else None
+        if count == 0:
+            avg_drifted = course.review_avg not in (None, 0)
+        else:
+            avg_drifted = course.review_avg is None or abs(course.review_avg - avg) > 1e-6
+        if course.review_count != count or course.review_rating_sum != rating_sum or avg_drifted:
+            course.review_count, course.review_rating_sum, course.review_avg = count, rating_sum, avg
+            drifted.append(course)
+    Course.objects.bulk_update(drifted, ['review_count', 'review_rating_sum', 'review_avg'], batch_size=500)
+    if drifted:
+        from jcourse_api.repository import invalidate_course_related
+        invalidate_course_related()
+    return len(drifted)
+
+
+def reconcile_review_reactions() -> int:
+    # 修正增量维护可能产生的偏差，返回被修正的点评数
+    stats = {row['review_id']: (row['approves'], row['disapproves']) for row in
+             ReviewReaction.objects.order_by().values('review_id').annotate(
+                 approves=Count('reaction', filter=Q(reaction=ReviewReaction.ReactionType.APPROVE)),
+                 disapproves=Count('reaction', filter=Q(reaction=ReviewReaction.ReactionType.DISAPPROVE)))}
+    drifted = []
+    for review in Review.objects.only('id', 'approve_count', 'disapprove_count').iterator():
+        approves, disapproves = stats.get(review.id, (0, 0))
+        if review.approve_count != approves or review.disapprove_count != disapproves:
+            review.approve_count, review.disapprove_count = approves, disapproves
+            drifted.append(review)
+    Review.objects.bulk_update(drifted, ['approve_count', 'disapprove_count'], batch_size=500)
+    return len(drifted)
+
+
+def index_review_fingerprint(review_id: int):
+    review = Review.objects.filter(pk=review_id).values('comment', 'created_at').first()
+    if review is None:
+        return
+    fingerprint = ReviewFingerprint.from_comment(review_id, review['comment'], review['created_at'])
+    fields = [f'band{i}' for i in range(10)] + ['created_at']
+    ReviewFingerprint.objects.update_or_create(
+        review_id=review_id, defaults={field: getattr(fingerprint, field) for field in fields})
+
+
+def find_review_fingerprint_candidates(bands: list[int], since) -> list[ReviewFingerprint]:
+    # 至少一段相同的作为候选，是否近似重复由调用方比较原文确定
+    condition = Q()
+    for i, band in enumerate(bands):
+        condition |= Q(**{f'band{i}': band})
+    return list(ReviewFingerprint.objects.filter(condition, created_at__gte=since).annotate(
+        user_id=F('review__user_id'), comment=F('review__comment')))
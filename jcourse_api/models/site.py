@@ -1,6 +1,11 @@
-from django.db import models
+from django.contrib.auth.models import User
+from django.db import models, transaction
+from django.db.models import Count
+from django.db.models.functions import TruncDate
 from django.utils import timezone
 
+from jcourse_api.models import Review
+
 
 class Announcement(models.Model):
     class Meta:
@@ -30,3 +35,41 @@ class ApiKey(models.Model):
 
     def __str__(self):
         return f"{self.description}：{self.key} - {self.modified_at}"
+
+
+class DailyStatistic(models.Model):
+    class Meta:
+        verbose_name = '每日统计'
+        verbose_name_plural = verbose_name
+        ordering = ['date']
+
+    date = models.DateField(verbose_name='日期', unique=True)
+    user_count = models.IntegerField(verbose_name='新用户数', default=0)
+    review_count = models.IntegerField(verbose_name='新点评数', default=0)
+    review_rating_counts = models.JSONField(verbose_name='新点评推荐指数分布', default=dict)
+
+    def __str__(self):
+        return f"{self.date}"
+
+
+def count_daily_statistics(users, reviews) -> dict:
+    # 按日期汇总新用户数、新点评数及其推荐指数分布
+    stats = {}
+    for row in users.order_by().values(date=TruncDate('date_joined')).annotate(count=Count('id')):
+        stats[row['date']] = DailyStatistic(date=row['date'], user_count=row['count'])
+    for row in reviews.order_by().values('rating', date=TruncDate('created_at')).annotate(count=Count('id')):
+        statistic = stats.setdefault(row['date'], DailyStatistic(date=row['date']))
+        statistic.review_count += row['count']
+        statistic.review_rating_counts[str(row['rating'])] = row['count']
+    return stats
+
+
+def rollup_daily_statistics() -> int:
+    # 重新汇总今天之前的所有数据，顺带修正删除、修改造成的偏差，返回汇总的天数
+    today_start = timezone.localtime().replace(hour=0, minute=0, second=0, microsecond=0)
+    stats = count_daily_statistics(User.objects.filter(date_joined__lt=today_start),
+                                   Review.objects.filter(created_at__lt=today_start))
+    with transaction.atomic():
+        DailyStatistic.objects.all().delete()
+        DailyStatistic.objects.bulk_create(stats.values(), batch_size=1000)
+    return len(stats)
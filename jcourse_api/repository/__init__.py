@@ -1,6 +1,13 @@
-from django.db.models import Subquery, OuterRef
+import datetime
+
+from django.contrib.postgres.search import TrigramSimilarity, SearchQuery, SearchRank
+from django.core.cache import cache
+from django.db.models import F, Case, When, Value, FloatField, Count, Avg, Sum, OuterRef, Subquery
+from django.db.models.functions import Greatest
+from django.utils import timezone
 
 from jcourse_api.models import *
+from utils.cut_word import cut_word
 
 
 def get_semesters():
@@ -11,26 +18,369 @@ def get_announcements():
     return Announcement.objects.filter(available=True)
 
 
+def get_daily_statistics() -> list[DailyStatistic]:
+    # 已汇总的历史数据加上汇总之后（通常只有今天）的实时增量
+    statistics = list(DailyStatistic.objects.all())
+    if statistics:
+        since = timezone.make_aware(
+            datetime.datetime.combine(statistics[-1].date + datetime.timedelta(days=1), datetime.time.min))
+        delta = count_daily_statistics(User.objects.filter(date_joined__gte=since),
+                                       Review.objects.filter(created_at__gte=since))
+    else:
+        # 尚未汇总过，退化为全量统计
+        delta = count_daily_statistics(User.objects.all(), Review.objects.all())
+    return statistics + sorted(delta.values(), key=lambda statistic: statistic.date)
+
+
+def build_former_code_cache_key():
+    return "former_code_map"
+
+
+def get_former_code_map() -> dict[str, str]:
+    # 旧课号 -> 当前课号，课号多次变更时直接映射到最新的课号
+    former_codes = cache.get(build_former_code_cache_key())
+    if former_codes is not None:
+        return former_codes
+    mapping = dict(FormerCode.objects.values_list('old_code', 'new_code'))
+    former_codes = {}
+    for old_code in mapping:
+        new_code, seen = mapping[old_code], {old_code}
+        while new_code in mapping and new_code not in seen:
+            seen.add(new_code)
+            new_code = mapping[new_code]
+        former_codes[old_code] = new_code
+    cache.set(build_former_code_cache_key(), former_codes, None)
+    return former_codes
+
+
+def invalidate_former_code_map():
+    cache.delete(build_former_code_cache_key())
+
+
+def get_course_code_aliases(code: str, former_codes: dict[str, str] = None) -> list[str]:
+    if former_codes is None:
+        former_codes = get_former_code_map()
+    new_code = former_codes.get(code)
+    if new_code is None or new_code == code:
+        return [code]
+    return [code, new_code]
+
+
+def pick_course_by_code_aliases(courses, codes: list[str]):
+    # 旧课号和当前课号的课程可能同时存在，优先精确匹配课号，没有时才使用别名
+    courses = {course.code: course for course in courses}
+    return next((courses[code] for code in codes if code in courses), None)
+
+
+# 课程数不超过该值时直接以字面量列表过滤，否则用子查询
+NOTIFICATION_LEVEL_LITERAL_LIMIT = 200
+NOTIFICATION_LEVEL_CACHE_TIMEOUT = 24 * 60 * 60
+
+
+def build_notification_level_course_ids_cache_key(user_id: int, notification_level: int):
+    return f"notification_level_course_ids_{user_id}_{notification_level}"
+
+
+def get_notification_level_course_ids(user: User, notification_level: int) -> list[int]:
+    key = build_notification_level_course_ids_cache_key(user.id, notification_level)
+    course_ids = cache.get(key)
+    if course_ids is None:
+        course_ids = list(CourseNotificationLevel.objects.filter(user=user, notification_level=notification_level)
+                          .values_list('course_id', flat=True))
+        cache.set(key, course_ids, NOTIFICATION_LEVEL_CACHE_TIMEOUT)
+    return course_ids
+
+
+def invalidate_notification_level_course_ids(user_id: int):
+    cache.delete_many([build_notification_level_course_ids_cache_key(user_id, notification_level)
+                       for notification_level in CourseNotificationLevel.NotificationLevelType])
+
+
+def get_notification_level_course_filter(user: User, notification_level: int, field: str = 'course_id'):
+    # 返回 None 表示用户没有该等级的课程
+    course_ids = get_notification_level_course_ids(user, notification_level)
+    if not course_ids:
+        return None
+    if len(course_ids) <= NOTIFICATION_LEVEL_LITERAL_LIMIT:
+        return Q(**{f'{field}__in': course_ids})
+    return Q(**{f'{field}__in': CourseNotificationLevel.objects.filter(
+        user=user, notification_level=notification_level).values('course_id')})
+
+
+# 同一课程在该时间窗口内的多条新点评只通知一次
+COURSE_NEW_REVIEW_COALESCE_WINDOW = 10 * 60
+
+
+def build_course_new_review_cache_key(course_id: int):
+    return f"course_new_review_{course_id}"
+
+
+def claim_course_new_review(course_id: int) -> bool:
+    # 窗口内第一次调用返回 True
+    return cache.add(build_course_new_review_cache_key(course_id), True, COURSE_NEW_REVIEW_COALESCE_WINDOW)
+
+
+UNREAD_NOTIFICATION_COUNT_CACHE_TIMEOUT = 24 * 60 * 60
+
+
+def build_unread_notification_count_cache_key(user_id: int):
+    return f"unread_notification_count_{user_id}"
+
+
+def get_unread_notifications(user: User):
+    return Notification.objects.filter(recipient=user, public=True, read_at__isnull=True)
+
+
+def get_unread_notification_count(user: User) -> int:
+    key = build_unread_notification_count_cache_key(user.id)
+    count = cache.get(key)
+    if count is None:
+        count = get_unread_notifications(user).count()
+        cache.set(key, count, UNREAD_NOTIFICATION_COUNT_CACHE_TIMEOUT)
+    return count
+
+
+def invalidate_unread_notification_count(user_ids):
+    cache.delete_many([build_unread_notification_count_cache_key(user_id) for user_id in set(user_ids)])
+
+
+USER_POINT_CACHE_TIMEOUT = 24 * 60 * 60
+
+
+def build_user_point_cache_key(user_id: int):
+    return f"user_point_{user_id}"
+
+
+def get_user_points_by_ids(user_ids: list[int]) -> dict[int, int]:
+    # 优先使用缓存中的积分，其余用户一次聚合查出
+    cached = cache.get_many([build_user_point_cache_key(user_id) for user_id in user_ids])
+    points = {user_id: cached[build_user_point_cache_key(user_id)]['points'] for user_id in user_ids
+              if build_user_point_cache_key(user_id) in cached}
+    missing = [user_id for user_id in user_ids if user_id not in points]
+    if missing:
+        points.update(UserPoint.objects.filter(user_id__in=missing).order_by().values('user_id')
+                      .annotate(sum=Sum('value')).values_list('user_id', 'sum'))
+    return {user_id: points.get(user_id, 0) for user_id in user_ids}
+
+
+def invalidate_user_point(user_id: int):
+    cache.delete(build_user_point_cache_key(user_id))
+
+
+def build_course_filter_cache_key():
+    return "course_filter"
+
+
+def get_course_filter() -> dict:
+    # 课程库只在导入或编辑时变化，缓存到失效为止
+    course_filter = cache.get(build_course_filter_cache_key())
+    if course_filter is None:
+        # 带 GROUP BY 的查询不会使用 Meta.ordering
+        categories = Category.objects.annotate(count=Count('course')).filter(count__gt=0) \
+            .values('id', 'name', 'count').order_by('name')
+        departments = Department.objects.annotate(count=Count('course')).filter(count__gt=0) \
+            .values('id', 'name', 'count').order_by('name')
+        course_filter = {'categories': list(categories), 'departments': list(departments)}
+        cache.set(build_course_filter_cache_key(), course_filter, None)
+    return course_filter
+
+
+def get_filtered_course_filter(courses) -> dict:
+    # 两个维度的计数用 UNION ALL 合成一条查询
+    courses = Course.objects.filter(id__in=courses.order_by().values('id'))
+    departments = courses.order_by().values(facet=Value('departments'), value_id=F('department_id'),
+                                            value_name=F('department__name')) \
+        .annotate(count=Count('id', distinct=True)).filter(value_id__isnull=False)
+    categories = courses.order_by().values(facet=Value('categories'), value_id=F('categories__id'),
+                                           value_name=F('categories__name')) \
+        .annotate(count=Count('id', distinct=True)).filter(value_id__isnull=False)
+    course_filter = {'categories': [], 'departments': []}
+    for row in departments.union(categories, all=True):
+        course_filter[row['facet']].append({'id': row['value_id'], 'name': row['value_name'], 'count': row['count']})
+    for values in course_filter.values():
+        values.sort(key=lambda value: value['name'])
+    return course_filter
+
+
+def invalidate_course_filter():
+    cache.delete(build_course_filter_cache_key())
+
+
+REVIEW_FILTER_CACHE_TIMEOUT = 24 * 60 * 60
+
+
+def build_review_filter_version_cache_key():
+    return "review_filter_version"
+
+
+def build_review_filter_cache_key(version: int, course_id: int | None):
+    return f"review_filter_{version}_{course_id or 'all'}"
+
+
+def get_review_filter_version() -> int:
+    version = cache.get(build_review_filter_version_cache_key())
+    if version is None:
+        version = 0
+        cache.add(build_review_filter_version_cache_key(), version, None)
+    return version
+
+
+def compute_review_filter(course_id: int | None) -> dict:
+    reviews = Review.objects.all()
+    if course_id:
+        reviews = reviews.filter(course_id=course_id)
+    semesters = reviews.values('semester') \
+        .annotate(count=Count('semester'), name=F("semester__name"), id=F("semester__id"), avg=Avg('rating')) \
+        .filter(count__gt=0).values("id", "name", "count", "avg").order_by(F('name').desc())
+    ratings = reviews.values('rating').annotate(count=Count('rating')).filter(count__gt=0).order_by(
+        F('rating').desc())
+    return {'semesters': list(semesters), 'ratings': list(ratings)}
+
+
+def get_review_filter(course_id: int | None) -> dict:
+    # 每门课的学期、推荐指数分布，点评变动时失效，学期变动时整体失效
+    key = build_review_filter_cache_key(get_review_filter_version(), course_id)
+    review_filter = cache.get(key)
+    if review_filter is None:
+        review_filter = compute_review_filter(course_id)
+        cache.set(key, review_filter, REVIEW_FILTER_CACHE_TIMEOUT)
+    return review_filter
+
+
+def invalidate_review_filter(course_ids=None):
+    # 不指定课程时让所有课程的缓存失效
+    if course_ids is None:
+        key = build_review_filter_version_cache_key()
+        try:
+            cache.incr(key)
+        except ValueError:
+            cache.add(key, 1, None)
+        return
+    version = get_review_filter_version()
+    cache.delete_many([build_review_filter_cache_key(version, course_id) for course_id in [None, *course_ids]])
+
+
+COURSE_RELATED_CACHE_TIMEOUT = 24 * 60 * 60
+
+
+def build_course_related_version_cache_key():
+    return "course_related_version"
+
+
+def build_related_teachers_cache_key(version: int, code: str):
+    return f"related_teachers_{version}_{code}"
+
+
+def build_related_courses_cache_key(version: int, teacher_id: int):
+    return f"related_courses_{version}_{teacher_id}"
+
+
+def get_course_related_version() -> int:
+    version = cache.get(build_course_related_version_cache_key())
+    if version is None:
+        version = 0
+        cache.add(build_course_related_version_cache_key(), version, None)
+    return version
+
+
+def get_course_related(course: Course) -> tuple[list[dict], list[dict]]:
+    # 按课号缓存同课号的所有课程，按教师缓存该教师的所有课程，取出后再排除当前课程
+    version = get_course_related_version()
+    teachers_key = build_related_teachers_cache_key(version, course.code)
+    courses_key = build_related_courses_cache_key(version, course.main_teacher_id)
+    cached = cache.get_many([teachers_key, courses_key])
+    ordering = [F('avg').desc(nulls_last=True), F('count').desc(nulls_last=True)]
+    missing = {}
+    same_code = cached.get(teachers_key)
+    if same_code is None:
+        same_code = missing[teachers_key] = list(
+            Course.objects.filter(code=course.code).values('id', 'main_teacher_id', avg=F('review_avg'),
+                                                           count=F('review_count'), tname=F('main_teacher__name'))
+            .order_by(*ordering))
+    same_teacher = cached.get(courses_key)
+    if same_teacher is None:
+        same_teacher = missing[courses_key] = list(
+            Course.objects.filter(main_teacher_id=course.main_teacher_id).values('id', 'code', 'name',
+                                                                                 avg=F('review_avg'),
+                                                                                 count=F('review_count'))
+            .order_by(*ordering))
+    if missing:
+        cache.set_many(missing, COURSE_RELATED_CACHE_TIMEOUT)
+    related_teachers = [{'id': row['id'], 'avg': row['avg'], 'count': row['count'], 'tname': row['tname']}
+                        for row in same_code if row['main_teacher_id'] != course.main_teacher_id]
+    related_courses = [row for row in same_teacher if row['code'] != course.code]
+    return related_teachers, related_courses
+
+
+def invalidate_course_related(course_ids=None):
+    # 不指定课程时让所有课程的缓存失效
+    if course_ids is None:
+        key = build_course_related_version_cache_key()
+        try:
+            cache.incr(key)
+        except ValueError:
+            cache.add(key, 1, None)
+        return
+    version = get_course_related_version()
+    keys = []
+    for code, teacher_id in Course.objects.filter(id__in=course_ids).values_list('code', 'main_teacher_id'):
+        keys.append(build_related_teachers_cache_key(version, code))
+        keys.append(build_related_courses_cache_key(version, teacher_id))
+    cache.delete_many(keys)
+
+
 def get_course_list_queryset(user: User):
-    return Course.objects.select_related('main_teacher').prefetch_related('categories', 'department')
+    return Course.objects.select_related('main_teacher', 'department').prefetch_related('categories')
+
+
+def get_course_detail_queryset(user: User):
+    courses = get_course_list_queryset(user)
+    if not user.is_authenticated:
+        return courses
+    # 当前用户的通知等级随课程一起查出
+    notification_level = CourseNotificationLevel.objects.filter(user=user, course=OuterRef('pk')) \
+        .values('notification_level')[:1]
+    return courses.annotate(my_notification_level=Subquery(notification_level))
 
 
 def get_search_course_queryset(q: str, user: User):
     courses = get_course_list_queryset(user)
     if q == '':
         return courses.none()
-    courses = courses.filter(
-        Q(code__icontains=q) | Q(name__icontains=q) | Q(main_teacher__name__icontains=q) |
-        Q(main_teacher__pinyin__iexact=q) | Q(main_teacher__abbr_pinyin__icontains=q))
-    return courses
+    # 课程和教师分别走各自的 pg_trgm 索引，再 UNION 成一个子查询，避免跨表 OR 导致整表扫描
+    matched_teachers = Teacher.objects.filter(
+        Q(name__icontains=q) | Q(pinyin__iexact=q) | Q(abbr_pinyin__icontains=q)).order_by().values('id')
+    conditions = Q(code__icontains=q) | Q(name__icontains=q)
+    # 搜索旧课号时也能找到改号后的课程
+    new_code = get_former_code_map().get(q.upper())
+    if new_code:
+        conditions = conditions | Q(code=new_code)
+    matched_courses = Course.objects.filter(conditions).order_by().values('id') \
+        .union(Course.objects.filter(main_teacher_id__in=matched_teachers).order_by().values('id'))
+    courses = courses.filter(id__in=matched_courses)
+    similarities = [TrigramSimilarity('code', q), TrigramSimilarity('name', q),
+                    TrigramSimilarity('main_teacher__name', q), TrigramSimilarity('main_teacher__pinyin', q),
+                    TrigramSimilarity('main_teacher__abbr_pinyin', q)]
+    if new_code:
+        similarities.append(Case(When(code=new_code, then=Value(1.0)), output_field=FloatField()))
+    relevance = Greatest(*similarities)
+    return courses.annotate(relevance=relevance).order_by(F('relevance').desc(nulls_last=True), 'code', 'id')
 
 
 def get_reviews(user: User):
-    reviews = Review.objects.select_related('course', 'course__main_teacher', 'semester')
-    if not user.is_authenticated:
-        return reviews
-    my_reaction = ReviewReaction.objects.filter(user=user, review_id=OuterRef('pk')).values('reaction')
-    return reviews.annotate(my_reaction=Subquery(my_reaction[:1]))
+    # 当前用户的回应由序列化器在分页后批量查询，见 ReviewCommonSerializer
+    return Review.objects.select_related('course', 'course__main_teacher', 'semester')
+
+
+def get_search_review_queryset(q: str, user: User):
+    reviews = get_reviews(user)
+    q = q.strip()
+    if q == '':
+        return reviews.none()
+    # 与 search_vector 相同的分词方式，search_vector 上有 GIN 索引
+    query = SearchQuery(cut_word(q), config='english')
+    return reviews.filter(search_vector=query).annotate(rank=SearchRank(F('search_vector'), query)) \
+        .order_by(F('rank').desc(), F('modified_at').desc(nulls_last=True), F('id').desc())
 
 
 def get_enrolled_courses(user: User):
@@ -39,3 +389,51 @@ def get_enrolled_courses(user: User):
 
 def get_my_reviewed(user: User):
     return Review.objects.filter(user=user).values('course_id', 'semester_id', 'id')
+
+
+COMMON_INFO_CACHE_TIMEOUT = 24 * 60 * 60
+
+
+def build_common_info_version_cache_key():
+    return "common_info_version"
+
+
+def build_common_info_cache_key(version: int):
+    return f"common_info_{version}"
+
+
+def build_user_common_info_cache_key(user_id: int):
+    return f"user_common_info_{user_id}"
+
+
+def get_common_info_version() -> int:
+    version = cache.get(build_common_info_version_cache_key())
+    if version is None:
+        version = 0
+        cache.add(build_common_info_version_cache_key(), version, None)
+    return version
+
+
+def invalidate_common_info():
+    # 公告、学期、推广内容变化时更新版本号，旧版本的缓存自然过期
+    key = build_common_info_version_cache_key()
+    try:
+        cache.incr(key)
+    except ValueError:
+        cache.add(key, 1, None)
+
+
+def get_user_common_info(user: User) -> dict:
+    if not user.is_authenticated:
+        return {'enrolled_courses': [], 'my_reviews': []}
+    key = build_user_common_info_cache_key(user.id)
+    user_common_info = cache.get(key)
+    if user_common_info is None:
+        user_common_info = {'enrolled_courses': list(get_enrolled_courses(user)),
+                            'my_reviews': list(get_my_reviewed(user))}
+        cache.set(key, user_common_info, COMMON_INFO_CACHE_TIMEOUT)
+    return user_common_info
+
+
+def invalidate_user_common_info(user_id: int):
+    cache.delete(build_user_common_info_cache_key(user_id))
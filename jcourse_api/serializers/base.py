@@ -4,6 +4,30 @@ from rest_framework import serializers
 from jcourse_api.models import Teacher, Semester, Announcement, Report, Notification, Category, Department, UserPoint
 
 
+_datetime_field = serializers.DateTimeField()
+
+
+def format_datetime(value):
+    # 与 DateTimeField 的输出一致：转换到当前时区后按 REST_FRAMEWORK 的 DATETIME_FORMAT 格式化
+    if value is None:
+        return None
+    return _datetime_field.to_representation(value)
+
+
+class FastListSerializer(serializers.ListSerializer):
+    """
+    子序列化器定义了 fast_representation 时逐行直接构造字典，跳过 DRF 逐字段的 get_attribute/to_representation，
+    输出必须与子序列化器的 to_representation 完全一致。
+    """
+
+    def to_representation(self, data):
+        items = data.all() if hasattr(data, 'all') else data
+        fast_representation = getattr(self.child, 'fast_representation', None)
+        if fast_representation is None:
+            return super().to_representation(items)
+        return [fast_representation(item) for item in items]
+
+
 class TeacherSerializer(serializers.ModelSerializer):
     class Meta:
         model = Teacher
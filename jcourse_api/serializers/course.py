@@ -1,8 +1,8 @@
-from django.db.models import F
 from rest_framework import serializers
 
 from jcourse_api.models import Course, Department, Category, CourseNotificationLevel
-from jcourse_api.serializers.base import TeacherSerializer
+from jcourse_api.repository import get_course_related
+from jcourse_api.serializers.base import TeacherSerializer, FastListSerializer
 
 
 def get_course_rating(obj: Course):
@@ -31,32 +31,33 @@ class CourseSerializer(serializers.ModelSerializer):
 
     class Meta:
         model = Course
-        exclude = ['review_count', 'review_avg', 'last_semester']
+        exclude = ['review_count', 'review_avg', 'review_rating_sum', 'last_semester']
 
     @staticmethod
     def get_rating(obj: Course):
         return get_course_rating(obj)
 
-    @staticmethod
-    def get_related_teachers(obj: Course):
-        return Course.objects.filter(code=obj.code).exclude(main_teacher=obj.main_teacher) \
-            .values('id', avg=F('review_avg'), count=F('review_count'),
-                    tname=F('main_teacher__name')).order_by(F('avg').desc(nulls_last=True),
-                                                            F('count').desc(nulls_last=True))
+    def get_related(self, obj: Course):
+        # related_teachers 和 related_courses 共用一次缓存查询
+        related = getattr(obj, '_related', None)
+        if related is None:
+            related = obj._related = get_course_related(obj)
+        return related
 
-    @staticmethod
-    def get_related_courses(obj: Course):
-        return Course.objects.filter(main_teacher=obj.main_teacher).exclude(code=obj.code) \
-            .values('id', 'code', 'name', avg=F('review_avg'),
-                    count=F('review_count')).order_by(F('avg').desc(nulls_last=True), F('count').desc(nulls_last=True))
+    def get_related_teachers(self, obj: Course):
+        return self.get_related(obj)[0]
+
+    def get_related_courses(self, obj: Course):
+        return self.get_related(obj)[1]
 
     def get_notification_level(self, obj):
+        # 详情页的查询集已经带上了当前用户的通知等级
+        if hasattr(obj, 'my_notification_level'):
+            return obj.my_notification_level
         request = self.context.get("request")
-        if request and hasattr(request, "user"):
-            try:
-                return CourseNotificationLevel.objects.get(user=request.user, course_id=obj.id).notification_level
-            except CourseNotificationLevel.DoesNotExist:
-                return None
+        if request and hasattr(request, "user") and request.user.is_authenticated:
+            return CourseNotificationLevel.objects.filter(user=request.user, course_id=obj.id) \
+                .values_list('notification_level', flat=True).first()
         return None
 
 
@@ -78,7 +79,9 @@ class CourseListSerializer(serializers.ModelSerializer):
 
     class Meta:
         model = Course
-        exclude = ['teacher_group', 'main_teacher', 'moderator_remark', 'review_count', 'review_avg', 'last_semester']
+        exclude = ['teacher_group', 'main_teacher', 'moderator_remark', 'review_count', 'review_avg', 'review_rating_sum',
+                   'last_semester']
+        list_serializer_class = FastListSerializer
 
     @staticmethod
     def get_rating(obj: Course):
@@ -88,6 +91,18 @@ class CourseListSerializer(serializers.ModelSerializer):
     def get_teacher(obj: Course):
         return obj.main_teacher.name
 
+    @staticmethod
+    def fast_representation(obj: Course):
+        department = obj.department
+        return {'id': obj.id,
+                'categories': [category.name for category in obj.categories.all()],
+                'department': department.name if department is not None else None,
+                'teacher': obj.main_teacher.name,
+                'rating': get_course_rating(obj),
+                'code': obj.code,
+                'name': obj.name,
+                'credit': float(obj.credit) if obj.credit is not None else None}
+
 
 class CourseInReviewListSerializer(serializers.ModelSerializer):
     teacher = serializers.SerializerMethodField()
@@ -100,6 +115,10 @@ class CourseInReviewListSerializer(serializers.ModelSerializer):
     def get_teacher(obj: Course):
         return obj.main_teacher.name
 
+    @staticmethod
+    def fast_representation(obj: Course):
+        return {'id': obj.id, 'code': obj.code, 'name': obj.name, 'teacher': obj.main_teacher.name}
+
 
 class CourseInWriteReviewSerializer(serializers.ModelSerializer):
     teacher = serializers.SerializerMethodField()
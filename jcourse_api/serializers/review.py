@@ -1,8 +1,8 @@
 from django.db import IntegrityError
 from rest_framework import serializers
 
-from jcourse_api.models import Review, ReviewRevision
-from jcourse_api.serializers.base import SemesterSerializer
+from jcourse_api.models import Review, ReviewRevision, ReviewReaction
+from jcourse_api.serializers.base import SemesterSerializer, FastListSerializer, format_datetime
 from jcourse_api.serializers.course import CourseInReviewListSerializer, CourseInWriteReviewSerializer
 
 
@@ -27,6 +27,21 @@ def get_review_reactions(obj):
     return reactions
 
 
+def get_request_user(serializer: serializers.Serializer):
+    request = serializer.context.get("request")
+    if request and hasattr(request, "user") and request.user.is_authenticated:
+        return request.user
+    return None
+
+
+def attach_my_reactions(reviews: list[Review], user):
+    # 一次 review_id IN (...) 查询当前用户的回应，代替逐行的相关子查询
+    reaction_map = dict(ReviewReaction.objects.filter(user=user, review_id__in=[review.id for review in reviews])
+                        .values_list('review_id', 'reaction'))
+    for review in reviews:
+        review.my_reaction = reaction_map.get(review.id)
+
+
 def is_my_review(serializer: serializers.Serializer, obj: Review):
     request = serializer.context.get("request")
     if request and hasattr(request, "user"):
@@ -35,6 +50,16 @@ def is_my_review(serializer: serializers.Serializer, obj: Review):
     return False
 
 
+class ReviewListSerializerWithReactions(FastListSerializer):
+
+    def to_representation(self, data):
+        reviews = list(data.all() if hasattr(data, 'all') else data)
+        user = get_request_user(self)
+        if user is not None:
+            attach_my_reactions(reviews, user)
+        return super().to_representation(reviews)
+
+
 class ReviewCommonSerializer(serializers.ModelSerializer):
     reactions = serializers.SerializerMethodField()
     is_mine = serializers.SerializerMethodField()
@@ -42,6 +67,15 @@ class ReviewCommonSerializer(serializers.ModelSerializer):
 
     class Meta:
         model = Review
+        list_serializer_class = ReviewListSerializerWithReactions
+
+    def to_representation(self, instance):
+        # 单条点评时列表序列化器不会预先填充
+        if not hasattr(instance, 'my_reaction'):
+            user = get_request_user(self)
+            if user is not None:
+                attach_my_reactions([instance], user)
+        return super().to_representation(instance)
 
     @staticmethod
     def get_semester(obj):
@@ -54,6 +88,21 @@ class ReviewCommonSerializer(serializers.ModelSerializer):
     def get_reactions(obj):
         return get_review_reactions(obj)
 
+    def fast_common_representation(self, obj: Review) -> dict:
+        return {'id': obj.id,
+                'reactions': get_review_reactions(obj),
+                'is_mine': is_my_review(self, obj),
+                'semester': obj.semester.name}
+
+    @staticmethod
+    def fast_fields_representation(obj: Review) -> dict:
+        return {'rating': obj.rating,
+                'comment': obj.comment,
+                'created_at': format_datetime(obj.created_at),
+                'modified_at': format_datetime(obj.modified_at),
+                'score': obj.score,
+                'moderator_remark': obj.moderator_remark}
+
 
 class ReviewListSerializer(ReviewCommonSerializer):
     course = CourseInReviewListSerializer(read_only=True)
@@ -61,6 +110,13 @@ class ReviewListSerializer(ReviewCommonSerializer):
     class Meta:
         model = Review
         exclude = ['user', 'approve_count', 'disapprove_count', 'search_vector']
+        list_serializer_class = ReviewListSerializerWithReactions
+
+    def fast_representation(self, obj: Review):
+        ret = self.fast_common_representation(obj)
+        ret['course'] = CourseInReviewListSerializer.fast_representation(obj.course)
+        ret.update(self.fast_fields_representation(obj))
+        return ret
 
 
 class ReviewItemSerializer(ReviewCommonSerializer):
@@ -70,6 +126,7 @@ class ReviewItemSerializer(ReviewCommonSerializer):
     class Meta:
         model = Review
         exclude = ['user', 'approve_count', 'disapprove_count', 'search_vector']
+        list_serializer_class = ReviewListSerializerWithReactions
 
     @staticmethod
     def get_course(obj):
@@ -81,6 +138,12 @@ class ReviewInCourseSerializer(ReviewCommonSerializer):
     class Meta:
         model = Review
         exclude = ('user', 'course', 'approve_count', 'disapprove_count', 'search_vector')
+        list_serializer_class = ReviewListSerializerWithReactions
+
+    def fast_representation(self, obj: Review):
+        ret = self.fast_common_representation(obj)
+        ret.update(self.fast_fields_representation(obj))
+        return ret
 
 
 class ReviewRevisionSerializer(serializers.ModelSerializer):
@@ -1,17 +1,93 @@
+from django.db import transaction
+
+from ad.models import Promotion
 from jcourse_api.models import *
+from jcourse_api.repository import invalidate_former_code_map, invalidate_notification_level_course_ids, \
+    invalidate_review_filter, invalidate_user_point, invalidate_common_info, invalidate_user_common_info, \
+    invalidate_unread_notification_count, invalidate_course_related, invalidate_course_filter
+from jcourse_api.utils.suggest import refresh_course_suggest
 
 
 def signal_delete_review_actions(sender, instance: ReviewReaction, **kwargs):
-    update_review_reactions(instance.review)
+    add_review_reaction(instance.review_id, instance.reaction, ReviewReaction.ReactionType.RESET)
 
 
 def signal_delete_course_reviews(sender, instance: Review, **kwargs):
-    update_course_reviews(instance.course)
+    add_course_review(instance.course_id, -instance.rating, -1)
+    course_ids = [instance.course_id]
+    transaction.on_commit(lambda: invalidate_review_filter(course_ids))
 
 
 def signal_notify_report_replied(sender, instance: Report, **kwargs):
     send_report_replied_notification(instance)
 
 
-def signal_notify_new_review_generated(sender, instance: Review, **kwargs):
-    find_course_new_review(instance.course)
+def signal_refresh_course_suggest(sender, instance: Course, update_fields=None, **kwargs):
+    # 点评数等统计字段的更新不影响联想索引
+    if update_fields is not None and not update_fields & {'code', 'name', 'main_teacher'}:
+        return
+    # 删除后 instance.id 会被置空，先取出
+    course_ids = [instance.id]
+    transaction.on_commit(lambda: refresh_course_suggest(course_ids))
+
+
+def signal_refresh_teacher_course_suggest(sender, instance: Teacher, update_fields=None, **kwargs):
+    if update_fields is not None and not update_fields & {'name', 'pinyin', 'abbr_pinyin'}:
+        return
+    course_ids = list(Course.objects.filter(main_teacher=instance).values_list('id', flat=True))
+    if course_ids:
+        transaction.on_commit(lambda: refresh_course_suggest(course_ids))
+
+
+def signal_invalidate_former_code_map(sender, instance: FormerCode, **kwargs):
+    # 提交前删除的话，并发请求可能把旧数据重新写回缓存
+    transaction.on_commit(invalidate_former_code_map)
+
+
+def signal_invalidate_notification_level(sender, instance: CourseNotificationLevel, **kwargs):
+    user_id = instance.user_id
+    transaction.on_commit(lambda: invalidate_notification_level_course_ids(user_id))
+
+
+def signal_invalidate_review_filter(sender, instance: Semester, **kwargs):
+    # 学期名称出现在所有课程的分布中
+    transaction.on_commit(invalidate_review_filter)
+
+
+def signal_invalidate_user_point(sender, instance: UserPoint, **kwargs):
+    user_id = instance.user_id
+    transaction.on_commit(lambda: invalidate_user_point(user_id))
+
+
+def signal_invalidate_common_info(sender, instance, update_fields=None, **kwargs):
+    # 推广内容的点击数不在公共信息中
+    if sender is Promotion and update_fields is not None and not update_fields - {'click_times'}:
+        return
+    transaction.on_commit(invalidate_common_info)
+
+
+def signal_invalidate_user_common_info(sender, instance: Review | EnrollCourse, update_fields=None, **kwargs):
+    if update_fields is not None and not update_fields & {'user', 'course', 'semester'}:
+        return
+    user_id = instance.user_id
+    transaction.on_commit(lambda: invalidate_user_common_info(user_id))
+
+
+def signal_invalidate_unread_notification_count(sender, instance: Notification, **kwargs):
+    user_ids = [instance.recipient_id]
+    transaction.on_commit(lambda: invalidate_unread_notification_count(user_ids))
+
+
+def signal_invalidate_course_related(sender, instance: Course | Teacher, update_fields=None, **kwargs):
+    # 课程、教师改动很少，直接让所有相关课程缓存失效
+    fields = {'code', 'name', 'main_teacher', 'review_avg', 'review_count'} if sender is Course else {'name'}
+    if update_fields is not None and not update_fields & fields:
+        return
+    transaction.on_commit(invalidate_course_related)
+
+
+def signal_invalidate_course_filter(sender, instance, update_fields=None, **kwargs):
+    # 课程的统计字段更新不影响筛选项
+    if sender is Course and update_fields is not None and 'department' not in update_fields:
+        return
+    transaction.on_commit(invalidate_course_filter)
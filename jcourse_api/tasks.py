@@ -1,6 +1,17 @@
-from huey.contrib.djhuey import task
+from huey import crontab
+from huey.contrib.djhuey import task, db_periodic_task, on_startup
 
+from jcourse_api.models import Review, reconcile_course_reviews, reconcile_review_reactions, \
+    rollup_daily_statistics, find_course_new_review, index_review_fingerprint
+from jcourse_api.repository import claim_course_new_review, COURSE_NEW_REVIEW_COALESCE_WINDOW
 from jcourse_api.utils import send_admin_email
+from utils.cut_word import get_cut_word_search_vector, get_tokenizer
+
+
+@on_startup()
+def load_tokenizer():
+    # 分词集中在 huey 任务中，consumer 启动时预先加载词典，web 进程仍按需加载
+    get_tokenizer()
 
 
 @task()
@@ -11,3 +22,56 @@ def send_report_email(comment: str, time: str):
 @task()
 def send_antispam_email(username: str, data: dict):
     send_admin_email('选课社区风控', f"用户：{username} 由于刷点评，已被自动封号。最近点评为：\n{data}")
+
+
+@task()
+def check_review_spam(review_id: int):
+    # jcourse_api.utils.spam 依赖本模块，延迟导入
+    from jcourse_api.utils import score_review_spam
+    if not score_review_spam(review_id):
+        notify_new_review(review_id)
+
+
+def notify_new_review(review_id: int):
+    # 关注者可能很多，同一课程的新点评在时间窗口内合并通知
+    course_id = Review.objects.filter(pk=review_id).values_list('course_id', flat=True).first()
+    if course_id is None or not claim_course_new_review(course_id):
+        return
+    find_course_new_review(course_id, review_id)
+    # 窗口内之后的点评在窗口结束时统一再通知一次
+    notify_course_new_review.schedule((course_id, review_id + 1), delay=COURSE_NEW_REVIEW_COALESCE_WINDOW)
+
+
+@task()
+def update_review_search_vector(review_id: int):
+    review = Review.objects.filter(pk=review_id).values('comment').first()
+    if review is None:
+        return
+    # 带上 comment 条件，避免排队期间点评又被修改时写入旧的分词结果
+    Review.objects.filter(pk=review_id, comment=review['comment']).update(
+        search_vector=get_cut_word_search_vector(review['comment']))
+
+
+@task()
+def update_review_fingerprint(review_id: int):
+    index_review_fingerprint(review_id)
+
+
+@task()
+def notify_course_new_review(course_id: int, since_review_id: int):
+    find_course_new_review(course_id, since_review_id)
+
+
+@db_periodic_task(crontab(hour='4', minute='0'))
+def reconcile_course_reviews_daily():
+    reconcile_course_reviews()
+
+
+@db_periodic_task(crontab(hour='4', minute='30'))
+def reconcile_review_reactions_daily():
+    reconcile_review_reactions()
+
+
+@db_periodic_task(crontab(hour='0', minute='5'))
+def rollup_daily_statistics_daily():
+    rollup_daily_statistics()
@@ -1,7 +1,18 @@
+import os
+import tempfile
+from unittest.mock import patch
+
+from django.core.management import call_command
+from django.db import connection
 from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
 from rest_framework.test import APIClient
 
+from jcourse_api.repository import invalidate_former_code_map, get_former_code_map, invalidate_course_related, \
+    invalidate_course_filter
+from jcourse_api.serializers import CourseListSerializer
 from jcourse_api.tests import *
+from jcourse_api.utils.suggest import course_suggest_index, invalidate_course_suggest
 
 
 class SemesterTest(TestCase):
@@ -47,6 +58,8 @@ class CourseTest(TestCase):
         self.user = User.objects.get(username='test')
         self.client.force_login(self.user)
         self.endpoint = '/api/course/'
+        invalidate_course_related()
+        self.addCleanup(invalidate_course_related)
 
     def test_auth(self):
         client = APIClient()  # another client
@@ -72,6 +85,14 @@ class CourseTest(TestCase):
         self.assertEqual(courses[0]['code'], 'CS1500')
         self.assertEqual(courses[0]['credit'], 4.0)
 
+    def test_fast_representation(self):
+        Course.objects.filter(code='CS2500').update(department=None, credit=2.5)
+        requests = [(self.endpoint, {}), ('/api/search/', {'q': 'MARX'}), ('/api/search/', {'q': 'CS'})]
+        fast = [self.client.get(endpoint, params).content for endpoint, params in requests]
+        with patch.object(CourseListSerializer, 'fast_representation', None):
+            slow = [self.client.get(endpoint, params).content for endpoint, params in requests]
+        self.assertEqual(fast, slow)
+
     def test_only_has_review(self):
         response = self.client.get(self.endpoint, {'onlyhasreviews': ''})
         courses = response.json()['results']
@@ -128,6 +149,24 @@ class CourseTest(TestCase):
         self.assertEqual(related_teachers[0]['count'], 0)
         self.assertEqual(len(course['related_courses']), 0)
         self.assertIsNone(course['moderator_remark'])
+        self.assertIsNone(course['notification_level'])
+
+    def test_retrieve_cache(self):
+        test_course = Course.objects.get(name='思想道德修养与法律基础', main_teacher=Teacher.objects.get(name='梁女士'))
+        other = Course.objects.get(code='MARX1001', main_teacher__name='赵先生')
+        CourseNotificationLevel.objects.create(user=self.user, course=test_course,
+                                               notification_level=CourseNotificationLevel.NotificationLevelType.FOLLOW)
+        self.client.get(self.endpoint + f"{test_course.pk}/")
+        with CaptureQueriesContext(connection) as queries:
+            course = self.client.get(self.endpoint + f"{test_course.pk}/").json()
+        self.assertEqual(course['notification_level'], CourseNotificationLevel.NotificationLevelType.FOLLOW)
+        # 会话、用户、课程（含教师、院系、通知等级）、类别、教师组
+        self.assertEqual(len(queries), 5)
+        user2 = User.objects.create(username='test2')
+        with self.captureOnCommitCallbacks(execute=True):
+            Review.objects.create(user=user2, course=other, comment='TEST', rating=5, score='W')
+        course = self.client.get(self.endpoint + f"{test_course.pk}/").json()
+        self.assertEqual(course['related_teachers'], [{'id': other.id, 'avg': 5.0, 'count': 1, 'tname': '赵先生'}])
 
     def test_not_found(self):
         response = self.client.get(self.endpoint + '5/')
@@ -141,6 +180,8 @@ class FilterTest(TestCase):
         self.user = User.objects.get(username='test')
         self.client.force_login(self.user)
         self.endpoint = '/api/course-filter/'
+        invalidate_course_filter()
+        self.addCleanup(invalidate_course_filter)
 
     def test_body(self):
         response = self.client.get(self.endpoint).json()
@@ -151,11 +192,62 @@ class FilterTest(TestCase):
                           {'id': Department.objects.get(name='SEIEE').pk, 'count': 2, 'name': 'SEIEE'}])
 
     def test_delete_course(self):
-        Course.objects.all().delete()
+        with self.captureOnCommitCallbacks(execute=True):
+            Course.objects.all().delete()
         response = self.client.get(self.endpoint).json()
         self.assertEqual(response['categories'], [])
         self.assertEqual(response['departments'], [])
 
+    def test_cache(self):
+        category = Category.objects.get(name='通识')
+        self.client.get(self.endpoint)
+        with self.captureOnCommitCallbacks(execute=True):
+            Course.objects.get(code='CS2500').categories.add(category)
+        response = self.client.get(self.endpoint).json()
+        self.assertEqual(response['categories'], [{'id': category.pk, 'count': 3, 'name': '通识'}])
+        # 只更新统计字段时不失效
+        with self.captureOnCommitCallbacks(execute=True):
+            Course.objects.filter(code='CS2500').update(department=Department.objects.get(name='PHYSICS'))
+            Course.objects.get(code='CS2500').save(update_fields=['review_count'])
+        response = self.client.get(self.endpoint).json()
+        self.assertEqual([department['count'] for department in response['departments']], [2, 2])
+        invalidate_course_filter()
+        response = self.client.get(self.endpoint).json()
+        self.assertEqual([department['count'] for department in response['departments']], [3, 1])
+
+    def test_filtered(self):
+        category = Category.objects.get(name='通识')
+        seiee = Department.objects.get(name='SEIEE')
+        physics = Department.objects.get(name='PHYSICS')
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(self.endpoint, {'categories': category.pk}).json()
+        self.assertEqual(len([query for query in queries if 'UNION' in query['sql']]), 1)
+        self.assertEqual(response['categories'], [{'id': category.pk, 'count': 2, 'name': '通识'}])
+        self.assertEqual(response['departments'], [{'id': physics.pk, 'count': 2, 'name': 'PHYSICS'}])
+        response = self.client.get(self.endpoint, {'department': f'{seiee.pk},{physics.pk}'}).json()
+        self.assertEqual(response['categories'], [{'id': category.pk, 'count': 2, 'name': '通识'}])
+        self.assertEqual([department['count'] for department in response['departments']], [2, 2])
+        response = self.client.get(self.endpoint, {'department': 'abc'})
+        self.assertEqual(response.status_code, 400)
+
+    def test_filtered_course_list_params(self):
+        # 与课程列表使用相同的筛选条件
+        category = Category.objects.get(name='通识')
+        course = Course.objects.get(code='CS2500')
+        Course.objects.filter(pk=course.pk).update(review_count=1)
+        response = self.client.get(self.endpoint, {'onlyhasreviews': 'count'}).json()
+        self.assertEqual(response['categories'], [])
+        self.assertEqual(response['departments'], [{'id': course.department_id, 'count': 1, 'name': 'SEIEE'}])
+        response = self.client.get(self.endpoint, {'onlyhasreviews': 'avg', 'categories': category.pk}).json()
+        self.assertEqual(response, {'categories': [], 'departments': []})
+        response = self.client.get(self.endpoint, {'notification_level': 1}).json()
+        self.assertEqual(response, {'categories': [], 'departments': []})
+        with self.captureOnCommitCallbacks(execute=True):
+            CourseNotificationLevel.objects.create(
+                user=self.user, course=course, notification_level=CourseNotificationLevel.NotificationLevelType.FOLLOW)
+        response = self.client.get(self.endpoint, {'notification_level': 1}).json()
+        self.assertEqual(response['departments'], [{'id': course.department_id, 'count': 1, 'name': 'SEIEE'}])
+
 
 class SearchTest(TestCase):
     def setUp(self) -> None:
@@ -194,6 +286,57 @@ class SearchTest(TestCase):
         names = [course['name'] for course in response['results']]
         self.assertIn('思想道德修养与法律基础', names)
 
+    def test_relevance(self):
+        response = self.client.get(self.endpoint, {'q': 'CS2500'}).json()
+        codes = [course['code'] for course in response['results']]
+        self.assertEqual(codes, ['CS2500'])
+        response = self.client.get(self.endpoint, {'q': 'CS15'}).json()
+        codes = [course['code'] for course in response['results']]
+        self.assertEqual(codes[0], 'CS1500')
+
+    def test_former_code(self):
+        self.addCleanup(invalidate_former_code_map)
+        response = self.client.get(self.endpoint, {'q': 'EE1400'}).json()
+        self.assertEqual(response['count'], 0)
+        with self.captureOnCommitCallbacks(execute=True):
+            FormerCode.objects.create(old_code='EE1400', new_code='CS1400')
+            FormerCode.objects.create(old_code='CS1400', new_code='CS1500')
+        response = self.client.get(self.endpoint, {'q': 'ee1400'}).json()
+        codes = [course['code'] for course in response['results']]
+        self.assertEqual(codes, ['CS1500'])
+        with self.captureOnCommitCallbacks(execute=True):
+            FormerCode.objects.filter(old_code='CS1400').delete()
+        self.assertEqual(get_former_code_map(), {'EE1400': 'CS1400'})
+
+
+class UpdateSemesterTest(TestCase):
+    def setUp(self) -> None:
+        create_test_env()
+        self.semester = Semester.objects.get(name='2021-2022-1')
+        with self.captureOnCommitCallbacks(execute=True):
+            FormerCode.objects.create(old_code='CS1400', new_code='CS1500')
+        self.addCleanup(invalidate_former_code_map)
+
+    def update_semester(self, rows: list[tuple[str, int]]):
+        fd, filename = tempfile.mkstemp(suffix='.csv')
+        self.addCleanup(os.remove, filename)
+        with os.fdopen(fd, 'w') as f:
+            f.write('code,main_teacher\n')
+            f.writelines(f'{code},{tid}\n' for code, tid in rows)
+        call_command('update_semester', file=filename, semester=self.semester.name, course=True)
+
+    def test_alias(self):
+        self.update_semester([('CS1400', 1)])
+        self.assertEqual(Course.objects.get(code='CS1500').last_semester, self.semester)
+
+    def test_exact_code_first(self):
+        teacher = Teacher.objects.get(tid=1)
+        old_course = Course.objects.create(code='CS1400', name='计算机科学导论', main_teacher=teacher)
+        self.update_semester([('CS1400', 1)])
+        old_course.refresh_from_db()
+        self.assertEqual(old_course.last_semester, self.semester)
+        self.assertIsNone(Course.objects.get(code='CS1500').last_semester)
+
 
 class CourseInReviewTest(TestCase):
     def setUp(self) -> None:
@@ -218,3 +361,61 @@ class CourseInReviewTest(TestCase):
         self.assertEqual(response['code'], 'CS1500')
         self.assertEqual(response['name'], '计算机科学导论')
         self.assertEqual(response['teacher'], '高女士')
+
+
+class CourseSuggestTest(TestCase):
+    def setUp(self) -> None:
+        create_test_env()
+        course_suggest_index.reset()
+        self.client = APIClient()
+        self.user = User.objects.get(username='test')
+        self.client.force_login(self.user)
+        self.endpoint = '/api/course-suggest/'
+
+    def test_auth(self):
+        self.client.logout()
+        response = self.client.get(self.endpoint, {'q': 'CS'})
+        self.assertEqual(response.status_code, 403)
+
+    def test_empty(self):
+        response = self.client.get(self.endpoint).json()
+        self.assertEqual(response, [])
+
+    def test_prefix(self):
+        response = self.client.get(self.endpoint, {'q': 'cs'}).json()
+        self.assertEqual([course['code'] for course in response], ['CS1500', 'CS2500'])
+        response = self.client.get(self.endpoint, {'q': '计算'}).json()
+        self.assertEqual(response, [{'id': response[0]['id'], 'code': 'CS1500', 'name': '计算机科学导论',
+                                     'teacher': '高女士'}])
+        response = self.client.get(self.endpoint, {'q': 'liang'}).json()
+        self.assertEqual(len(response), 1)
+        self.assertEqual(response[0]['teacher'], '梁女士')
+        response = self.client.get(self.endpoint, {'q': 'ZH'}).json()
+        self.assertEqual(response[0]['teacher'], '赵先生')
+
+    def test_incremental_update(self):
+        self.client.get(self.endpoint, {'q': 'cs'})
+        course = Course.objects.get(code='CS2500')
+        with self.captureOnCommitCallbacks(execute=True):
+            course.code = 'EE2500'
+            course.save()
+        codes = [course['code'] for course in self.client.get(self.endpoint, {'q': 'cs'}).json()]
+        self.assertEqual(codes, ['CS1500'])
+        codes = [course['code'] for course in self.client.get(self.endpoint, {'q': 'ee'}).json()]
+        self.assertEqual(codes, ['EE2500'])
+        teacher = Teacher.objects.get(name='高女士')
+        with self.captureOnCommitCallbacks(execute=True):
+            teacher.pinyin = 'gaoxf'
+            teacher.save()
+        self.assertEqual(len(self.client.get(self.endpoint, {'q': 'gaoxiao'}).json()), 0)
+        self.assertEqual(len(self.client.get(self.endpoint, {'q': 'gaoxf'}).json()), 2)
+        with self.captureOnCommitCallbacks(execute=True):
+            course.delete()
+        self.assertEqual(len(self.client.get(self.endpoint, {'q': 'ee'}).json()), 0)
+
+    def test_stale_version(self):
+        self.client.get(self.endpoint, {'q': 'cs'})
+        Course.objects.filter(code='CS2500').update(code='EE2500')
+        invalidate_course_suggest()
+        codes = [course['code'] for course in self.client.get(self.endpoint, {'q': 'ee'}).json()]
+        self.assertEqual(codes, ['EE2500'])
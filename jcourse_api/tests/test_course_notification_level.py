@@ -1,7 +1,13 @@
+from unittest.mock import patch
+
+from django.core.cache import cache
 from django.test import TestCase
+from huey.contrib.djhuey import HUEY
 from rest_framework.test import APIClient
 
 from jcourse_api.models import *
+from jcourse_api.repository import build_course_new_review_cache_key
+from jcourse_api.tasks import check_review_spam
 from jcourse_api.tests import create_test_env
 
 
@@ -83,16 +89,58 @@ class CourseNotificationLevelTest(TestCase):
         self.assertEqual(my_course_notification_level.notification_level,
                          CourseNotificationLevel.NotificationLevelType.FOLLOW)
 
-    # def test_notify_new_review_generated(self):
-    #     count = Notification.objects.count()
-    #     CourseNotificationLevel.objects.create(
-    #         user=self.user,
-    #         course=self.course3,
-    #         notification_level=CourseNotificationLevel.NotificationLevelType.FOLLOW,
-    #     )
-    #     Review.objects.create(user=self.user, course=self.course3, comment='TEST', rating=3, score='W',
-    #                           semester=Semester.objects.get(name='2021-2022-1'))
-    #     self.assertEqual(Notification.objects.count(), count + 1)
+    def test_notify_new_review_generated(self):
+        self.addCleanup(cache.delete, build_course_new_review_cache_key(self.course3.id))
+        HUEY.storage.flush_schedule()
+        self.addCleanup(HUEY.storage.flush_schedule)
+        count = Notification.objects.count()
+        CourseNotificationLevel.objects.bulk_create([CourseNotificationLevel(
+            user=user, course=self.course3, notification_level=CourseNotificationLevel.NotificationLevelType.FOLLOW)
+            for user in (self.user1, self.user2)])
+        self.create_review(self.user)
+        # 作者自己不会收到通知
+        self.assertEqual(Notification.objects.count(), count + 1)
+        self.assertFalse(Notification.objects.filter(recipient=self.user, object_id=self.course3.id,
+                                                     type=Notification.NotificationType.COURSES_NEW_REVIEW).exists())
+
+    def create_review(self, user: User):
+        # 新点评通过异步的垃圾点评检查后才通知关注者
+        review = Review.objects.create(user=user, course=self.course3, comment=f'{user.username} 觉得这门课不错',
+                                       rating=3, score='W')
+        check_review_spam(review.id)
+
+    def run_scheduled_tasks(self):
+        for task in HUEY.scheduled():
+            HUEY.execute(task, timestamp=task.eta)
+        HUEY.storage.flush_schedule()
+
+    def test_notify_new_review_coalesced(self):
+        self.addCleanup(cache.delete, build_course_new_review_cache_key(self.course3.id))
+        HUEY.storage.flush_schedule()
+        self.addCleanup(HUEY.storage.flush_schedule)
+        CourseNotificationLevel.objects.bulk_create([CourseNotificationLevel(
+            user=user, course=self.course3, notification_level=CourseNotificationLevel.NotificationLevelType.FOLLOW)
+            for user in (self.user1, self.user2, self.user3)])
+        self.create_review(self.user2)
+        notifications = Notification.objects.filter(object_id=self.course3.id,
+                                                    type=Notification.NotificationType.COURSES_NEW_REVIEW)
+        self.assertEqual(notifications.count(), 2)
+        # 窗口内的新点评不立即通知
+        self.create_review(self.user3)
+        self.assertEqual(notifications.count(), 2)
+        # 窗口结束时统一通知，第一条点评的作者也会收到
+        self.run_scheduled_tasks()
+        self.assertEqual(notifications.count(), 3)
+        self.assertTrue(notifications.filter(recipient=self.user2).exists())
+        # 窗口过后，未读旧通知的关注者也不再重复通知
+        cache.delete(build_course_new_review_cache_key(self.course3.id))
+        notifications.filter(recipient=self.user1).update(read_at=timezone.now())
+        user4 = User.objects.create(username='test4')
+        self.create_review(user4)
+        self.assertEqual(notifications.count(), 4)
+        # 窗口内没有新点评时不再通知
+        self.run_scheduled_tasks()
+        self.assertEqual(notifications.count(), 4)
 
     def test_course_follow_list(self):
         response = self.client1.get('/api/course/?notification_level=1').json()
@@ -136,3 +184,24 @@ class CourseNotificationLevelTest(TestCase):
 
         response = self.client2.get('/api/review/?notification_level=1').json()
         self.assertEqual(int(response['count']), 0)
+
+    def test_review_follow_list_cache(self):
+        response = self.client1.get('/api/review/').json()
+        self.assertEqual(int(response['count']), 5)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client1.post(f'/api/course/{self.course1.id}/notification_level/', {'level': '2'})
+        response = self.client1.get('/api/review/').json()
+        self.assertEqual(int(response['count']), 3)
+        response = self.client1.get('/api/review/?notification_level=1').json()
+        self.assertEqual(int(response['count']), 3)
+        with self.captureOnCommitCallbacks(execute=True):
+            CourseNotificationLevel.objects.filter(user=self.user).delete()
+        response = self.client1.get('/api/review/').json()
+        self.assertEqual(int(response['count']), 6)
+
+    def test_review_follow_list_subquery(self):
+        with patch('jcourse_api.repository.NOTIFICATION_LEVEL_LITERAL_LIMIT', 0):
+            response = self.client1.get('/api/review/?notification_level=1').json()
+            self.assertEqual(int(response['count']), 5)
+            response = self.client1.get('/api/review/').json()
+            self.assertEqual(int(response['count']), 5)
@@ -1,8 +1,13 @@
 import datetime
+import subprocess
+import sys
 
 from django.test import TestCase
 from rest_framework.test import APIClient
 
+from ad.models import Promotion
+from jcourse_api.management.commands.benchmark import STARTUP_SCRIPT, parse_import_time
+from jcourse_api.repository import get_daily_statistics, invalidate_common_info, invalidate_user_common_info
 from jcourse_api.tests import *
 from oauth.utils import hash_username
 
@@ -51,6 +56,26 @@ class StatisticTest(TestCase):
         self.assertIsNotNone(response['user_join_time'])
         self.assertIsNotNone(response['review_create_time'])
 
+    def test_rollup(self):
+        yesterday = timezone.now() - datetime.timedelta(days=1)
+        User.objects.filter(username='test').update(date_joined=yesterday)
+        Review.objects.update(created_at=yesterday)
+        self.assertEqual(rollup_daily_statistics(), 1)
+        statistic = DailyStatistic.objects.get()
+        self.assertEqual(statistic.date, timezone.localdate(yesterday))
+        self.assertEqual((statistic.user_count, statistic.review_count), (1, 1))
+        self.assertEqual(statistic.review_rating_counts, {'3': 1})
+
+        create_review('test2', 'CS2500', 5)
+        statistics = get_daily_statistics()
+        self.assertEqual(len(statistics), 2)
+        self.assertEqual(statistics[-1].date, timezone.localdate())
+        self.assertEqual((statistics[-1].user_count, statistics[-1].review_count), (1, 1))
+        self.assertEqual(statistics[-1].review_rating_counts, {'5': 1})
+        # 今天的数据不进入汇总表
+        self.assertEqual(rollup_daily_statistics(), 1)
+        self.assertEqual(len(get_daily_statistics()), 2)
+
 
 class ApiKeyTest(TestCase):
     def setUp(self) -> None:
@@ -86,6 +111,19 @@ class ApiKeyTest(TestCase):
         response = self.client.post(self.endpoint, data, HTTP_API_KEY="123457")
         self.assertEqual(response.status_code, 400)
 
+    def test_batch(self):
+        user2 = User.objects.create(username=hash_username('test2'))
+        UserPoint.objects.create(user=user2, value=5, description='test')
+        UserPoint.objects.create(user=user2, value=-2, description='test')
+        data = {'accounts': ['test', 'test2', 'test3']}
+        response = self.client.post('/api/points/batch/', data, format='json', HTTP_API_KEY="123456").json()
+        self.assertEqual(response['points'], {'test': 0, 'test2': 3})
+        response = self.client.post('/api/points/batch/', data, format='json', HTTP_API_KEY="123457")
+        self.assertEqual(response.status_code, 400)
+        data = {'accounts': [f'test{i}' for i in range(101)]}
+        response = self.client.post('/api/points/batch/', data, format='json', HTTP_API_KEY="123456")
+        self.assertEqual(response.status_code, 400)
+
 
 class CommonInfoTestCase(TestCase):
 
@@ -96,6 +134,9 @@ class CommonInfoTestCase(TestCase):
         self.endpoint = '/api/common/'
         self.user = User.objects.get(username='test')
         self.client.force_login(self.user)
+        invalidate_common_info()
+        self.addCleanup(invalidate_common_info)
+        self.addCleanup(invalidate_user_common_info, self.user.id)
 
         self.announcement = Announcement.objects.create(title='TEST3', message='Just a test notice',
                                                         created_at=timezone.now(),
@@ -116,3 +157,53 @@ class CommonInfoTestCase(TestCase):
         self.assertEqual(resp["my_reviews"][0],
                          {"semester_id": self.review.semester_id, "course_id": self.review.course_id,
                           "id": self.review.id})
+
+    def test_etag(self):
+        resp = self.client.get(self.endpoint)
+        etag = resp.headers['ETag']
+        resp = self.client.get(self.endpoint, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(resp.status_code, 304)
+        self.assertEqual(resp.headers['ETag'], etag)
+        with self.captureOnCommitCallbacks(execute=True):
+            Announcement.objects.create(title='TEST4', message='Another notice', available=True)
+        resp = self.client.get(self.endpoint, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(len(resp.json()["announcements"]), 2)
+        self.assertNotEqual(resp.headers['ETag'], etag)
+
+    def test_user_cache(self):
+        resp = self.client.get(self.endpoint).json()
+        self.assertEqual(len(resp["my_reviews"]), 1)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.review.delete()
+            EnrollCourse.objects.create(course=Course.objects.last(), semester=self.semester, user=self.user)
+        resp = self.client.get(self.endpoint).json()
+        self.assertEqual(resp["my_reviews"], [])
+        self.assertEqual(len(resp["enrolled_courses"]), 2)
+        # 推广内容的点击不影响公共信息
+        promotion = Promotion.objects.create(available=True, external_image='https://example.com/1.png')
+        invalidate_common_info()
+        resp = self.client.get(self.endpoint)
+        etag = resp.headers['ETag']
+        with self.captureOnCommitCallbacks(execute=True) as callbacks:
+            self.client.post(f'/api/promotion/{promotion.id}/click/')
+        self.assertEqual(len(callbacks), 0)
+        resp = self.client.get(self.endpoint, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(resp.status_code, 304)
+
+
+class StartupTest(TestCase):
+    def test_jieba_not_loaded(self):
+        result = subprocess.run([sys.executable, '-c', STARTUP_SCRIPT], capture_output=True, text=True)
+        self.assertEqual(result.returncode, 0, result.stderr)
+        self.assertEqual(result.stdout.split()[-1], 'False')
+
+    def test_parse_import_time(self):
+        stderr = 'import time: self [us] | cumulative | imported package\n' \
+                 'import time:       100 |        100 |   jieba\n' \
+                 'import time:       200 |       1300 | jcourse_api.tasks\n' \
+                 'import time:       300 |        300 | django.contrib.admin.apps\n' \
+                 'import time:       400 |        400 | django.db\n' \
+                 'import time:       500 |        500 | json\n'
+        self.assertEqual(parse_import_time(stderr, ['jcourse_api', 'django.contrib.admin', 'django']),
+                         {'jcourse_api': 1.3, 'django.contrib.admin': 0.3, 'django': 0.4, 'other': 0.5})
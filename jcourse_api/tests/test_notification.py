@@ -4,6 +4,7 @@ from django.test import TestCase
 from rest_framework.test import APIClient
 
 from jcourse_api.models import *
+from jcourse_api.repository import invalidate_unread_notification_count
 
 
 class NotificationTest(TestCase):
@@ -94,3 +95,41 @@ class NotificationTest(TestCase):
         client.force_login(user8)
         response = client.post(f'{self.endpoint}{self.notification2.id}/read/', {'read': '1'})
         self.assertEqual(response.status_code, 404)
+
+    def test_unread_count(self):
+        self.addCleanup(invalidate_unread_notification_count, [self.user.id])
+        self.create_env()
+        response = self.client.get(f'{self.endpoint}unread-count/').json()
+        self.assertEqual(response['count'], 1)
+        with self.captureOnCommitCallbacks(execute=True):
+            Notification.objects.create(recipient=self.user, type=1)
+        response = self.client.get(f'{self.endpoint}unread-count/').json()
+        self.assertEqual(response['count'], 2)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(f'{self.endpoint}{self.notification2.id}/read/', {'read': '1'})
+        response = self.client.get(f'{self.endpoint}unread-count/').json()
+        self.assertEqual(response['count'], 1)
+
+    def test_bulk_read(self):
+        self.addCleanup(invalidate_unread_notification_count, [self.user.id])
+        self.create_env()
+        notification5 = Notification.objects.create(recipient=self.user, type=1)
+        response = self.client.post(f'{self.endpoint}bulk-read/', {'read': 1, 'ids': [self.notification2.id]},
+                                    format='json').json()
+        self.assertEqual(response, {'count': 1, 'unread': 1})
+        response = self.client.post(f'{self.endpoint}bulk-read/', {'read': 1}, format='json').json()
+        self.assertEqual(response, {'count': 1, 'unread': 0})
+        notification5.refresh_from_db()
+        self.assertIsNotNone(notification5.read_at)
+        # 其他用户的通知不受影响
+        self.notification1.refresh_from_db()
+        self.assertIsNone(self.notification1.read_at)
+        response = self.client.post(f'{self.endpoint}bulk-read/', {'read': 0}, format='json').json()
+        self.assertEqual(response, {'count': 3, 'unread': 3})
+        response = self.client.post(f'{self.endpoint}bulk-read/', {'ids': [1]}, format='json')
+        self.assertEqual(response.status_code, 400)
+        response = self.client.post(f'{self.endpoint}bulk-read/', {'read': 1, 'ids': 'all'}, format='json')
+        self.assertEqual(response.status_code, 400)
+        for read in ('yes', None, [1]):
+            response = self.client.post(f'{self.endpoint}bulk-read/', {'read': read}, format='json')
+            self.assertEqual(response.status_code, 400)
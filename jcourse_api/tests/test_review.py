@@ -1,7 +1,20 @@
+from datetime import timedelta
+from io import StringIO
+from unittest.mock import patch
+
+from django.core.cache import cache
+from django.core.management import call_command
 from django.test import TestCase
+from django.utils import timezone
+from huey.contrib.djhuey import HUEY
 from rest_framework.test import APIClient
 
+from jcourse import settings
+from jcourse.paginations import KeysetPagination
+from jcourse_api.repository import invalidate_review_filter, build_course_new_review_cache_key
+from jcourse_api.serializers import ReviewListSerializer, ReviewInCourseSerializer
 from jcourse_api.tests import *
+from utils.minhash import text_bands
 
 
 class ReviewTest(TestCase):
@@ -69,6 +82,30 @@ class ReviewTest(TestCase):
         self.assertIsNotNone(review['modified_at'])
         self.assertEqual(review['modified_at'], review['created_at'])
 
+    def test_my_reactions(self):
+        review2 = create_review('test2', 'CS2500')
+        review3 = create_review('test3', 'MARX1001')
+        ReviewReaction.objects.create(review=review2, user=self.user, reaction=-1)
+        response = self.client.get(self.endpoint).json()
+        reactions = {review['id']: review['reactions']['reaction'] for review in response['results']}
+        self.assertEqual(reactions, {self.review.id: 1, review2.id: -1, review3.id: None})
+        response = self.client.get(f'{self.endpoint}{review2.id}/').json()
+        self.assertEqual(response['reactions']['reaction'], -1)
+        response = self.client.get(f'/api/course/{review3.course_id}/review/').json()
+        self.assertIsNone(response['results'][0]['reactions']['reaction'])
+
+    def test_fast_representation(self):
+        review2 = create_review('test2', 'CS2500')
+        create_review('test3', 'CS1500', 5)
+        ReviewReaction.objects.create(review=review2, user=self.user, reaction=-1)
+        Review.objects.filter(pk=review2.pk).update(moderator_remark='REMARK', score='')
+        endpoints = [self.endpoint, f'/api/course/{self.review.course_id}/review/']
+        fast = [self.client.get(endpoint).content for endpoint in endpoints]
+        with patch.object(ReviewListSerializer, 'fast_representation', None), \
+                patch.object(ReviewInCourseSerializer, 'fast_representation', None):
+            slow = [self.client.get(endpoint).content for endpoint in endpoints]
+        self.assertEqual(fast, slow)
+
     def test_course_avg_count(self):
         course = Course.objects.get(code='CS1500')
         response = self.client.get(f'/api/course/{course.id}/').json()
@@ -183,6 +220,161 @@ class ReviewTest(TestCase):
         self.assertEqual(response.status_code, 201)  # 允许学期为空
 
 
+class CourseReviewAggregateTest(TestCase):
+    def setUp(self) -> None:
+        create_test_env()
+        self.course = Course.objects.get(code='CS1500')
+        self.other_course = Course.objects.get(code='CS2500')
+        self.review = create_review(rating=3)
+
+    def assertAggregate(self, course: Course, count: int, rating_sum: int, avg):
+        course.refresh_from_db()
+        self.assertEqual(course.review_count, count)
+        self.assertEqual(course.review_rating_sum, rating_sum)
+        self.assertEqual(course.review_avg, avg)
+
+    def test_create(self):
+        create_review('test2', rating=4)
+        self.assertAggregate(self.course, 2, 7, 3.5)
+
+    def test_modify_rating(self):
+        review = Review.objects.get(pk=self.review.pk)
+        review.rating = 5
+        with self.assertNumQueries(2):
+            review.save()
+        self.assertAggregate(self.course, 1, 5, 5)
+
+    def test_move_course(self):
+        self.review.course = self.other_course
+        self.review.rating = 1
+        self.review.save()
+        self.assertAggregate(self.course, 0, 0, None)
+        self.assertAggregate(self.other_course, 1, 1, 1)
+
+    def test_delete(self):
+        create_review('test2', rating=4)
+        self.review.delete()
+        self.assertAggregate(self.course, 1, 4, 4)
+
+    def test_reconcile(self):
+        Course.objects.filter(pk=self.course.pk).update(review_count=10, review_rating_sum=1, review_avg=0.1)
+        self.assertEqual(reconcile_course_reviews(), 1)
+        self.assertAggregate(self.course, 1, 3, 3)
+        self.assertEqual(reconcile_course_reviews(), 0)
+
+
+class ReviewCursorTest(TestCase):
+    def setUp(self) -> None:
+        create_test_env()
+        self.client = APIClient()
+        self.user = User.objects.get(username='test')
+        self.client.force_login(self.user)
+        self.endpoint = '/api/review/'
+        now = timezone.now()
+        self.reviews = []
+        for i, course in enumerate(Course.objects.order_by('id')):
+            review = create_review(f'test{i}', course.code)
+            # 前两条修改时间相同，用 id 区分先后
+            Review.objects.filter(pk=review.pk).update(modified_at=now - timedelta(minutes=i // 2 * 2),
+                                                       approve_count=i % 2)
+            self.reviews.append(review.pk)
+
+    def walk(self, params: dict):
+        ids = []
+        response = self.client.get(self.endpoint, {'cursor': '', 'size': 1, **params})
+        while True:
+            self.assertEqual(response.status_code, 200)
+            response = response.json()
+            self.assertNotIn('count', response)
+            ids.extend(review['id'] for review in response['results'])
+            if response['next'] is None:
+                return ids
+            response = self.client.get(response['next'])
+
+    def test_modified_at(self):
+        ids = self.walk({})
+        expected = list(Review.objects.order_by(F('modified_at').desc(), F('id').desc()).values_list('id', flat=True))
+        self.assertEqual(ids, expected)
+
+    def test_approves(self):
+        ids = self.walk({'order': 'approves'})
+        expected = list(Review.objects.order_by(F('approve_count').desc(), F('created_at').desc(), F('id').desc())
+                        .values_list('id', flat=True))
+        self.assertEqual(ids, expected)
+
+    def test_page_number(self):
+        response = self.client.get(self.endpoint, {'size': 1}).json()
+        self.assertEqual(response['count'], len(self.reviews))
+
+    def test_invalid_cursor(self):
+        response = self.client.get(self.endpoint, {'cursor': 'invalid'})
+        self.assertEqual(response.status_code, 404)
+        response = self.client.get(self.endpoint, {'cursor': 'WyJhIl0='})
+        self.assertEqual(response.status_code, 404)
+        # 长度正确但类型与排序键不一致
+        for cursor in ([1, 2], ['2024-01-01T00:00:00+00:00', '2024-01-01T00:00:00+00:00'], [True, 1],
+                       ['2024-01-01T00:00:00+00:00', 2 ** 64]):
+            response = self.client.get(self.endpoint, {'cursor': KeysetPagination.encode_cursor(cursor)})
+            self.assertEqual(response.status_code, 404)
+        cursor = KeysetPagination.encode_cursor([1, '2024-01-01T00:00:00+00:00', 1])
+        response = self.client.get(self.endpoint, {'cursor': cursor, 'order': 'approves'})
+        self.assertEqual(response.status_code, 200)
+        response = self.client.get(self.endpoint, {'cursor': KeysetPagination.encode_cursor([1, 1, 1]),
+                                                   'order': 'approves'})
+        self.assertEqual(response.status_code, 404)
+
+
+class ReviewSearchTest(TestCase):
+    def setUp(self) -> None:
+        create_test_env()
+        self.client = APIClient()
+        self.user = User.objects.get(username='test')
+        self.client.force_login(self.user)
+        self.endpoint = '/api/review/search/'
+        with self.captureOnCommitCallbacks(execute=True):
+            self.review = create_review()
+            self.review.comment = '老师讲课很认真，作业量适中'
+            self.review.save()
+
+    def test_vector_updated(self):
+        self.review.refresh_from_db()
+        self.assertIsNotNone(self.review.search_vector)
+        with self.captureOnCommitCallbacks(execute=True):
+            review = create_review('test2', 'CS2500')
+        review.refresh_from_db()
+        self.assertIsNotNone(review.search_vector)
+
+    def test_empty(self):
+        response = self.client.get(self.endpoint).json()
+        self.assertEqual(response['count'], 0)
+
+    def test_search(self):
+        response = self.client.get(self.endpoint, {'q': '作业'}).json()
+        self.assertEqual(response['count'], 1)
+        self.assertEqual(response['results'][0]['id'], self.review.id)
+        response = self.client.get(self.endpoint, {'q': '考试'}).json()
+        self.assertEqual(response['count'], 0)
+
+    def test_rank(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            review = create_review('test2', 'CS2500')
+            review.comment = '作业很多，作业很难，作业占比高'
+            review.save()
+        response = self.client.get(self.endpoint, {'q': '作业'}).json()
+        self.assertEqual([review['id'] for review in response['results']], [review.id, self.review.id])
+
+    def test_backfill_command(self):
+        Review.objects.update(search_vector=None)
+        call_command('update_search_vector', batch_size=1, stdout=StringIO())
+        self.assertFalse(Review.objects.filter(search_vector__isnull=True).exists())
+        response = self.client.get(self.endpoint, {'q': '作业'}).json()
+        self.assertEqual(response['count'], 1)
+
+
+SPAM_COMMENT = '加群领取期末复习资料和往年试卷答案，所有课程全覆盖，保证高分通过，名额有限先到先得'
+NORMAL_COMMENT = '这门课作业很多，期末考试难度适中，老师讲课清楚，推荐认真听讲'
+
+
 class SpamTest(TestCase):
 
     def setUp(self) -> None:
@@ -192,21 +384,111 @@ class SpamTest(TestCase):
         self.client.force_login(self.user)
         self.endpoint = '/api/review/'
 
+    def post(self, client: APIClient, course: Course, comment: str):
+        # 提交后执行异步的检查
+        with self.captureOnCommitCallbacks(execute=True):
+            response = client.post(self.endpoint, {'course': course.id, 'score': '100', 'comment': comment,
+                                                   'rating': 5})
+        self.assertEqual(response.status_code, 201)
+        return response.json()['id']
+
+    def assert_spam(self, review_id: int, spam: bool):
+        self.assertEqual(not Review.objects.filter(pk=review_id).exists(), spam)
+        self.assertEqual(ReviewRevision.objects.filter(user=self.user, comment__isnull=False).exists(), spam)
+        self.user.refresh_from_db()
+        self.assertEqual(self.user.is_active, not spam)
+
     def test_spam(self):
         courses = Course.objects.all()
-        course = courses[0]
-        response = self.client.post(self.endpoint,
-                                    {'course': course.id, 'score': '100', 'comment': 'TEST', 'rating': 5})
-        self.assertEqual(response.status_code, 201)
-        course = courses[1]
-        response = self.client.post(self.endpoint,
-                                    {'course': course.id, 'score': '100', 'comment': 'TEST', 'rating': 5})
-        self.assertEqual(response.status_code, 201)
-        course = courses[2]
-        response = self.client.post(self.endpoint,
-                                    {'course': course.id, 'score': '100', 'comment': 'TEST', 'rating': 5})
+        self.post(self.client, courses[0], 'TEST')
+        self.post(self.client, courses[1], 'TEST')
+        self.assert_spam(self.post(self.client, courses[2], 'TEST'), True)
+        self.assertIsNotNone(self.user.userprofile.suspended_till)
+        self.assertEqual(Review.objects.filter(user=self.user).count(), 2)
+
+    def test_rate(self):
+        courses = Course.objects.all()
+        for i in range(3):
+            self.post(self.client, courses[i], f'{SPAM_COMMENT[i * 10:]}{i}')
+        course = Course.objects.create(code='EE0501', name='电路理论', credit=4, department=courses[0].department,
+                                       main_teacher=courses[0].main_teacher)
+        # 默认开启，但上限比内容规则宽松
+        self.assertGreater(settings.REVIEW_RATE_LIMIT, 3)
+        with patch('jcourse.settings.REVIEW_RATE_LIMIT', 3):
+            response = self.client.post(self.endpoint, {'course': course.id, 'score': '100', 'comment': 'TEST',
+                                                         'rating': 5})
         self.assertEqual(response.status_code, 400)
-        self.assertEqual(response.json()["error"], "由于大量刷点评，您已被封号，如有疑问请邮件联系")
+        self.assertEqual(response.json()["error"], "发布点评过于频繁，请稍后再试")
+        with patch('jcourse.settings.REVIEW_RATE_LIMIT', 0):
+            self.post(self.client, course, 'TEST')
+        self.user.refresh_from_db()
+        self.assertTrue(self.user.is_active)
+
+    def test_spam_not_notified(self):
+        courses = list(Course.objects.order_by('id'))
+        follower = User.objects.create(username='follower')
+        CourseNotificationLevel.objects.create(user=follower, course=courses[2],
+                                               notification_level=CourseNotificationLevel.NotificationLevelType.FOLLOW)
+        self.addCleanup(cache.delete, build_course_new_review_cache_key(courses[2].id))
+        self.addCleanup(HUEY.storage.flush_schedule)
+        notifications = Notification.objects.filter(recipient=follower,
+                                                    type=Notification.NotificationType.COURSES_NEW_REVIEW)
+        self.post(self.client, courses[0], 'TEST')
+        self.post(self.client, courses[1], 'TEST')
+        # 被判定为垃圾点评时不通知关注者
+        self.assert_spam(self.post(self.client, courses[2], 'TEST'), True)
+        self.assertFalse(notifications.exists())
+        client = APIClient()
+        client.force_login(User.objects.create(username='other'))
+        self.post(client, courses[2], 'TEST')
+        self.assertTrue(notifications.exists())
+
+    def post_from_other_users(self, comment: str):
+        courses = Course.objects.all()
+        for i in range(2):
+            client = APIClient()
+            client.force_login(User.objects.create(username=f'spam{i}'))
+            self.post(client, courses[i], comment)
+
+    def test_similar_one_word_edit(self):
+        courses = list(Course.objects.order_by('id'))
+        self.post(self.client, courses[0], SPAM_COMMENT)
+        self.post(self.client, courses[1], SPAM_COMMENT.replace('加群', '加微信'))
+        self.assert_spam(self.post(self.client, courses[2], SPAM_COMMENT.replace('往年试卷', '历年真题')), True)
+
+    def test_similar_users(self):
+        self.post_from_other_users(SPAM_COMMENT)
+        self.assertEqual(ReviewFingerprint.objects.count(), 2)
+        self.assert_spam(self.post(self.client, Course.objects.all()[2], SPAM_COMMENT.replace('加群', '加微信')), True)
+
+    def test_similar_users_different_comment(self):
+        self.post_from_other_users(SPAM_COMMENT)
+        self.assert_spam(self.post(self.client, Course.objects.all()[2], NORMAL_COMMENT), False)
+
+    def test_similar_users_short_comment(self):
+        self.post_from_other_users('很好的课')
+        self.assert_spam(self.post(self.client, Course.objects.all()[2], '很好的课'), False)
+
+    def test_similar_users_expired(self):
+        self.post_from_other_users(SPAM_COMMENT)
+        ReviewFingerprint.objects.update(created_at=timezone.now() - timedelta(days=30))
+        self.assert_spam(self.post(self.client, Course.objects.all()[2], SPAM_COMMENT), False)
+
+    def test_fingerprint(self):
+        # 只改一个词的点评至少有一段相同，无关的点评没有
+        bands = text_bands(SPAM_COMMENT)
+        for comment in (SPAM_COMMENT.replace('加群', '加微信'), SPAM_COMMENT.replace('往年试卷', '历年真题'),
+                        SPAM_COMMENT.replace('名额有限', '人数不多')):
+            self.assertTrue(any(a == b for a, b in zip(bands, text_bands(comment))))
+        self.assertFalse(any(a == b for a, b in zip(bands, text_bands(NORMAL_COMMENT))))
+
+    def test_fingerprint_command(self):
+        review = create_review()
+        call_command('update_review_fingerprint', batch_size=1, stdout=StringIO())
+        fingerprint = ReviewFingerprint.objects.get(review=review)
+        self.assertEqual(fingerprint.created_at, review.created_at)
+        self.assertEqual(find_review_fingerprint_candidates(text_bands(review.comment), review.created_at),
+                         [fingerprint])
 
 
 class ReviewRevisionTest(TestCase):
@@ -317,6 +599,37 @@ class ReviewReactionTest(TestCase):
         self.assertEqual(response['disapproves'], 0)
         self.check_review_action(0, 0, 0)
 
+    def test_invalid_reaction(self):
+        response = self.client.post(self.endpoint, {'reaction': 2})
+        self.assertEqual(response.status_code, 400)
+        response = self.client.post(self.endpoint, {'reaction': 'abc'})
+        self.assertEqual(response.status_code, 400)
+
+    def test_switch(self):
+        self.client.post(self.endpoint, {'reaction': 1})
+        response = self.client.post(self.endpoint, {'reaction': -1}).json()
+        self.assertEqual(response['approves'], 1)
+        self.assertEqual(response['disapproves'], 1)
+        response = self.client.post(self.endpoint, {'reaction': -1}).json()
+        self.assertEqual(response['approves'], 1)
+        self.assertEqual(response['disapproves'], 1)
+        self.check_review_action(-1, 1, 1)
+
+    def test_delete_reaction(self):
+        self.client.post(self.endpoint, {'reaction': -1})
+        ReviewReaction.objects.filter(user=self.user).delete()
+        self.review.refresh_from_db()
+        self.assertEqual(self.review.approve_count, 1)
+        self.assertEqual(self.review.disapprove_count, 0)
+
+    def test_reconcile(self):
+        Review.objects.filter(pk=self.review.pk).update(approve_count=5, disapprove_count=3)
+        self.assertEqual(reconcile_review_reactions(), 1)
+        self.review.refresh_from_db()
+        self.assertEqual(self.review.approve_count, 1)
+        self.assertEqual(self.review.disapprove_count, 0)
+        self.assertEqual(reconcile_review_reactions(), 0)
+
 
 class FilterTest(TestCase):
     def setUp(self) -> None:
@@ -379,6 +692,39 @@ class FilterTest(TestCase):
         self.assertEqual(response['ratings'],
                          [{'rating': 5, 'count': 1}, {'rating': 3, 'count': 1}, {'rating': 1, 'count': 1}])
 
+    def test_body_cache(self):
+        self.addCleanup(invalidate_review_filter)
+        response = self.client1.get('/api/review-filter/', {'course_id': str(self.course1.id)}).json()
+        self.assertEqual(len(response['ratings']), 3)
+        response = self.client1.get('/api/review-filter/').json()
+        self.assertEqual(sum(rating['count'] for rating in response['ratings']), 7)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.review7.rating = 5
+            self.review7.save()
+        response = self.client1.get('/api/review-filter/', {'course_id': str(self.course1.id)}).json()
+        self.assertEqual(response['ratings'], [{'rating': 5, 'count': 2}, {'rating': 3, 'count': 1}])
+        with self.captureOnCommitCallbacks(execute=True):
+            self.review5.course = self.course2
+            self.review5.save()
+        response = self.client1.get('/api/review-filter/', {'course_id': str(self.course1.id)}).json()
+        self.assertEqual(response['semesters'],
+                         [{'id': self.semester1.id, 'name': self.semester1.name, 'count': 2, 'avg': 5.0}])
+        response = self.client1.get('/api/review-filter/', {'course_id': str(self.course2.id)}).json()
+        self.assertEqual(response['ratings'], [{'rating': 3, 'count': 2}])
+        with self.captureOnCommitCallbacks(execute=True):
+            self.review1.delete()
+        response = self.client1.get('/api/review-filter/', {'course_id': str(self.course1.id)}).json()
+        self.assertEqual(response['ratings'], [{'rating': 5, 'count': 1}])
+        response = self.client1.get('/api/review-filter/').json()
+        self.assertEqual(sum(rating['count'] for rating in response['ratings']), 6)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.semester1.name = '2021-2022-0'
+            self.semester1.save()
+        response = self.client1.get('/api/review-filter/', {'course_id': str(self.course1.id)}).json()
+        self.assertEqual(response['semesters'][0]['name'], '2021-2022-0')
+        response = self.client1.get('/api/review-filter/', {'course_id': 'abc'})
+        self.assertEqual(response.status_code, 400)
+
     def test_order(self):
         course_id = self.course1.id
         response = self.client1.get(f'/api/course/{course_id}/review/').json()
@@ -6,6 +6,7 @@ from django.test import TestCase
 from rest_framework.test import APIClient
 
 from jcourse_api.tests import *
+from jcourse_api.repository import invalidate_former_code_map, invalidate_user_point
 from jcourse_api.views import *
 
 
@@ -48,6 +49,18 @@ class UserPointTest(TestCase):
         self.assertEqual(len(details), 1)
         self.assertEqual(details[0]['value'], 100)
 
+    def test_points_cache(self):
+        self.addCleanup(invalidate_user_point, self.user.id)
+        self.assertEqual(self.client.get(self.endpoint).json()['points'], 100)
+        with self.captureOnCommitCallbacks(execute=True):
+            point = UserPoint.objects.create(user=self.user, value=-30, description='test')
+        response = self.client.get(self.endpoint).json()
+        self.assertEqual(response['points'], 70)
+        self.assertEqual(len(response['details']), 2)
+        with self.captureOnCommitCallbacks(execute=True):
+            point.delete()
+        self.assertEqual(self.client.get(self.endpoint).json()['points'], 100)
+
     def test_bad_reviews(self):
         user2 = User.objects.create(username='test2')
         user3 = User.objects.create(username='test3')
@@ -140,6 +153,43 @@ class SyncTest(TestCase):
         target = Course.objects.get(code='MARX1001', main_teacher__name='梁女士')
         self.assertEqual(target.id, ids[0])
 
+    def test_match_lessons(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            FormerCode.objects.create(old_code='CS1400', new_code='CS1500')
+        self.addCleanup(invalidate_former_code_map)
+        cs1500 = Course.objects.get(code='CS1500')
+        marx = Course.objects.get(code='MARX1001', main_teacher__name='梁女士')
+        with self.assertNumQueries(2):
+            matches = match_lessons([('CS1400', '高女士'), ('MARX1001', '梁女士'), ('MARX1001', '高女士'),
+                                     ('CS1500', '高女士')])
+        self.assertEqual(matches, [{'code': 'CS1400', 'teacher': '高女士', 'course_ids': [cs1500.id]},
+                                   {'code': 'MARX1001', 'teacher': '梁女士', 'course_ids': [marx.id]},
+                                   {'code': 'MARX1001', 'teacher': '高女士', 'course_ids': []},
+                                   {'code': 'CS1500', 'teacher': '高女士', 'course_ids': [cs1500.id]}])
+        self.assertEqual(get_matched_course_ids(matches), [cs1500.id, marx.id])
+
+    def test_match_lessons_exact_code_first(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            FormerCode.objects.create(old_code='CS1400', new_code='CS1500')
+        self.addCleanup(invalidate_former_code_map)
+        old_course = Course.objects.create(code='CS1400', name='计算机科学导论',
+                                           main_teacher=Teacher.objects.get(name='高女士'))
+        cs1500 = Course.objects.get(code='CS1500')
+        matches = match_lessons([('CS1400', '高女士'), ('CS1500', '高女士')])
+        self.assertEqual([match['course_ids'] for match in matches], [[old_course.id], [cs1500.id]])
+        sync_enroll_course(self.user, get_matched_course_ids(match_lessons([('CS1400', '高女士')])), '2021-2022-1')
+        self.assertEqual(list(EnrollCourse.objects.filter(user=self.user).values_list('course_id', flat=True)),
+                         [old_course.id])
+
+    def test_sync_queries(self):
+        self.create_former_enroll()
+        course_ids = list(Course.objects.filter(code='CS1500').values_list('id', flat=True))
+        # 学期、已选课程、删除（先取出记录以发送信号）、插入
+        with self.assertNumQueries(5):
+            sync_enroll_course(self.user, course_ids, '2021-2022-1')
+        with self.assertNumQueries(2):
+            sync_enroll_course(self.user, course_ids, '2021-2022-1')
+
     def create_former_enroll(self):
         withdrawn_course = Course.objects.get(code='MARX1001', main_teacher__name='赵先生')
         semester = Semester.objects.get(name='2021-2022-1')
@@ -201,3 +251,15 @@ class SyncV2Test(TestCase):
         self.assertEqual(response.status_code, 200)
         enrolled = EnrollCourse.objects.filter(user=self.user)
         self.assertEqual(len(enrolled), 2)
+        self.assertEqual([len(lesson['course_ids']) for lesson in response.json()['lessons']], [1, 1])
+
+    def test_former_code(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            FormerCode.objects.create(old_code='CS1400', new_code='CS1500')
+        self.addCleanup(invalidate_former_code_map)
+        response = self.client.post(self.endpoint, data=json.dumps([
+            {'code': 'CS1400', 'name': '计算机科学导论', 'teachers': '高女士', 'semester': '2021-2022-1'}
+        ]), content_type='application/json')
+        self.assertEqual(response.status_code, 200)
+        enrolled = EnrollCourse.objects.get(user=self.user)
+        self.assertEqual(enrolled.course.code, 'CS1500')
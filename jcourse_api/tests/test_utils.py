@@ -1,9 +1,22 @@
+import datetime
+import decimal
 from io import StringIO
+from unittest.mock import patch
 
+from django.core.cache import cache
 from django.test import TestCase
+from django.utils import timezone
+from rest_framework.renderers import JSONRenderer
 
+from jcourse import renderers
+from jcourse.renderers import FastJSONRenderer
+
+from jcourse_api.repository import invalidate_review_filter, get_review_filter, compute_review_filter, \
+    get_user_common_info, invalidate_user_common_info
 from jcourse_api.tests import create_test_env, create_review
 from jcourse_api.utils import *
+from utils import cut_word as cut_word_module
+from utils.cut_word import cut_word, cut_words, build_cut_word_cache_key
 
 
 class MergeCourseTest(TestCase):
@@ -34,6 +47,23 @@ class MergeCourseTest(TestCase):
         # 新的不变
         self.assertEqual(EnrollCourse.objects.get(pk=enroll2.pk).course, new_course)
 
+    def test_merge_course_review_filter(self):
+        new_course = Course.objects.create(code='NEW1500', main_teacher=self.old_teacher)
+        self.addCleanup(invalidate_review_filter)
+        self.assertEqual(get_review_filter(new_course.id), compute_review_filter(new_course.id))
+        merge_course(self.old_course, new_course)
+        self.assertEqual(get_review_filter(new_course.id), compute_review_filter(new_course.id))
+        self.assertEqual(sum(item['count'] for item in get_review_filter(new_course.id)['ratings']), 1)
+
+    def test_merge_course_user_common_info(self):
+        new_course = Course.objects.create(code='NEW1500', main_teacher=self.old_teacher)
+        self.addCleanup(invalidate_user_common_info, self.user.id)
+        get_user_common_info(self.user)
+        merge_course(self.old_course, new_course)
+        user_common_info = get_user_common_info(self.user)
+        self.assertEqual([review['course_id'] for review in user_common_info['my_reviews']], [new_course.id])
+        self.assertEqual([enroll['course_id'] for enroll in user_common_info['enrolled_courses']], [new_course.id])
+
     def test_merge_course_by_id(self):
         self.assertEqual(merge_course_by_id(10, 20), False)
         new_course = Course.objects.create(code='NEW1500', main_teacher=self.old_teacher)
@@ -139,3 +169,50 @@ class ExportTest(TestCase):
                          f"MARX1001,思想道德修养与法律基础,梁女士,{Course.objects.get(code='MARX1001', main_teacher__name='梁女士').pk}\r\n"
                          f"MARX1001,思想道德修养与法律基础,赵先生,{Course.objects.get(code='MARX1001', main_teacher__name='赵先生').pk}\r\n")
         sio.close()
+
+
+class FastJSONRendererTest(TestCase):
+    def setUp(self) -> None:
+        create_test_env()
+        create_review()
+        now = timezone.now().replace(microsecond=123456)
+        self.data = {'text': '中文\u2028"\\', 'int': 2 ** 40, 'float': 4.5, 'decimal': decimal.Decimal('3.25'),
+                     'datetime': now, 'naive': datetime.datetime(2024, 1, 2, 3, 4, 5),
+                     'date': now.date(), 'time': datetime.time(1, 2, 3, 456789), 'none': None, 'bool': True,
+                     'tuple': (1, 2), 'values': Course.objects.order_by('code').values('code', 'credit'),
+                     'nested': [{'a': []}, {}]}
+
+    def test_same_as_json_renderer(self):
+        self.assertEqual(FastJSONRenderer().render(self.data), JSONRenderer().render(self.data))
+        self.assertEqual(FastJSONRenderer().render(None), b'')
+
+    def test_fallback(self):
+        data = {'big': 2 ** 80, 1: 'key'}
+        self.assertEqual(FastJSONRenderer().render(data), JSONRenderer().render(data))
+        self.assertEqual(FastJSONRenderer().render(self.data, 'application/json; indent=2'),
+                         JSONRenderer().render(self.data, 'application/json; indent=2'))
+        with patch.object(renderers, 'orjson', None):
+            self.assertEqual(FastJSONRenderer().render(self.data), JSONRenderer().render(self.data))
+
+
+class CutWordsTest(TestCase):
+    def setUp(self) -> None:
+        self.raws = ['作业很多，考试不难', '老师讲课清楚', '作业很多，考试不难', '']
+        self.expected = [cut_word(raw) for raw in self.raws]
+        cache.delete_many([build_cut_word_cache_key(raw) for raw in self.raws])
+        self.addCleanup(cache.delete_many, [build_cut_word_cache_key(raw) for raw in self.raws])
+
+    def test_cut_words(self):
+        with patch.object(cut_word_module, 'cut_word', wraps=cut_word) as mock_cut_word:
+            self.assertEqual(cut_words(self.raws), self.expected)
+            self.assertEqual(mock_cut_word.call_count, 3)
+            self.assertEqual(cut_words(self.raws), self.expected)
+            self.assertEqual(mock_cut_word.call_count, 3)
+        self.assertEqual(cache.get(build_cut_word_cache_key(self.raws[1])), self.expected[1])
+
+    def test_processes(self):
+        # 子进程通过 fork 复用已加载的词典
+        with patch.object(cut_word_module.multiprocessing, 'get_context',
+                          wraps=cut_word_module.multiprocessing.get_context) as mock_get_context:
+            self.assertEqual(cut_words(self.raws, processes=2), self.expected)
+        mock_get_context.assert_called_once_with('fork')
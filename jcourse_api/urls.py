@@ -19,10 +19,12 @@ router.register('notification', NotificationViewSet, basename='notification')
 urlpatterns = [
     path('', include(router.urls)),
     path('me/', UserView.as_view(), name='me'),
+    path('course-suggest/', CourseSuggestView.as_view(), name='course-suggest'),
     path('course-filter/', CourseFilterView.as_view(), name='course-filter'),
     path('review-filter/', ReviewFilterView.as_view(), name='review-filter'),
     path('statistic/', StatisticView.as_view(), name='statistic'),
     path('points/', UserPointView.as_view(), name='user-points'),
+    path('points/batch/', UserPointBatchView.as_view(), name='user-points-batch'),
     path('sync-lessons/<str:term>/', sync_lessons, name='sync-lessons'),
     path('sync-lessons/', sync_lessons, name='sync-lessons'),
     path('sync-lessons-v2/', sync_lessons_v2, name='sync-lessons-v2'),
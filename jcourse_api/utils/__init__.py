@@ -5,3 +5,4 @@ from .email import *
 from .spam import *
 from .duplicate import *
 from .rename import *
+from .suggest import *
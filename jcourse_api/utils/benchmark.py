@@ -0,0 +1,24 @@
+import statistics
+import time
+from typing import Callable
+
+
+def measure(func: Callable, times: int = 100, warmup: int = 5) -> dict:
+    # 返回单位为毫秒
+    for _ in range(warmup):
+        func()
+    costs = []
+    for _ in range(times):
+        start = time.perf_counter()
+        func()
+        costs.append((time.perf_counter() - start) * 1000)
+    costs.sort()
+    return {'mean': statistics.fmean(costs),
+            'p50': costs[int(len(costs) * 0.5)],
+            'p95': costs[min(int(len(costs) * 0.95), len(costs) - 1)],
+            'max': costs[-1]}
+
+
+def format_measure(name: str, result: dict) -> str:
+    return f"{name}: mean {result['mean']:.2f}ms p50 {result['p50']:.2f}ms " \
+           f"p95 {result['p95']:.2f}ms max {result['max']:.2f}ms"
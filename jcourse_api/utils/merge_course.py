@@ -1,14 +1,19 @@
 from typing import Callable
 
 from jcourse_api.models import *
+from jcourse_api.repository import invalidate_review_filter, invalidate_user_common_info
 
 
 def merge_course(old_course: Course, new_course: Course) -> bool:
     if old_course == new_course:
         return False
     reviews = Review.objects.filter(course=old_course)
+    # 点评和选课记录都用 update 转移，不触发信号，需要手动清除这些用户的 my_reviews、enrolled_courses 缓存
+    user_ids = set(reviews.values_list('user_id', flat=True)) | \
+               set(EnrollCourse.objects.filter(course=old_course).values_list('user_id', flat=True))
     reviews.update(course=new_course)
     update_course_reviews(new_course)
+    invalidate_review_filter([old_course.id, new_course.id])
     # 查询同时选了两门课的用户，删除旧记录
     new_enrolls = EnrollCourse.objects.filter(course=new_course).values('user')
     common = EnrollCourse.objects.filter(user__in=new_enrolls, course=old_course)
@@ -16,6 +21,8 @@ def merge_course(old_course: Course, new_course: Course) -> bool:
         common.delete()
     # 更新记录
     EnrollCourse.objects.filter(course=old_course).update(course=new_course)
+    for user_id in user_ids:
+        invalidate_user_common_info(user_id)
     old_course.delete()
     return True
 
@@ -1,6 +1,8 @@
 from django.db import transaction
 
 from jcourse_api.models import *
+from jcourse_api.repository import invalidate_notification_level_course_ids, invalidate_user_point, \
+    invalidate_user_common_info, invalidate_unread_notification_count
 from oauth.models import *
 from oauth.utils import hash_username
 
@@ -15,7 +17,16 @@ def merge_user(old_user: User, new_user: User) -> bool:
         Notification.objects.filter(recipient=old_user).update(recipient=new_user)
         CourseNotificationLevel.objects.filter(user=old_user).update(user=new_user)
         UserProfile.objects.filter(user=old_user).update(user=new_user)
+        old_user_id = old_user.id
         old_user.delete()
+    # update() 不触发信号
+    invalidate_notification_level_course_ids(old_user_id)
+    invalidate_notification_level_course_ids(new_user.id)
+    invalidate_user_point(old_user_id)
+    invalidate_user_point(new_user.id)
+    invalidate_user_common_info(old_user_id)
+    invalidate_user_common_info(new_user.id)
+    invalidate_unread_notification_count([old_user_id, new_user.id])
     return True
 
 
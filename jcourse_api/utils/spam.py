@@ -2,23 +2,33 @@ import datetime
 import difflib
 
 from django.contrib.auth.models import User
-from django.db.models import QuerySet
+from django.db import transaction
 
 import utils.common
-from jcourse_api.models import Review, Course
+from jcourse_api.models import Review, Course, ReviewRevision, find_review_fingerprint_candidates
 from jcourse_api.tasks import send_antispam_email
 from oauth.utils import get_user_profile
+from utils.minhash import normalize, text_bands
 
 SPAM_MAX_REVIEWS = 3
 SPAM_PERIOD_MINUTES = 5
 SPAM_SIMILAR_RATIO = 0.85
+# 跨账号复制粘贴：近 N 天内内容近似重复的其它账号数
+SPAM_SIMILAR_DAYS = 7
+SPAM_SIMILAR_USERS = 2
+# 过短的点评（如“很好”）天然相似，不参与跨账号比较
+SPAM_SIMILAR_MIN_LENGTH = 15
 
 
-def similar_rule(data: dict, reviews: QuerySet):
-    comment = data["comment"]
-    count = 0
+def get_similar_matcher(comment: str) -> difflib.SequenceMatcher:
     s = difflib.SequenceMatcher(lambda x: x in " \t\n\r:,.：，。")
     s.set_seq1(comment)
+    return s
+
+
+def similar_rule(data: dict, reviews: list[Review]):
+    count = 0
+    s = get_similar_matcher(data["comment"])
     for review in reviews:
         s.set_seq2(review.comment)
         if s.quick_ratio() > SPAM_SIMILAR_RATIO:
@@ -26,7 +36,23 @@ def similar_rule(data: dict, reviews: QuerySet):
     return count * 2 >= SPAM_MAX_REVIEWS
 
 
-def course_rule(data: dict, reviews: QuerySet):
+def similar_users_rule(user: User, comment: str, time: datetime.datetime):
+    if len(normalize(comment)) < SPAM_SIMILAR_MIN_LENGTH:
+        return False
+    since = time - datetime.timedelta(days=SPAM_SIMILAR_DAYS)
+    # 指纹索引只负责召回候选，与同一用户的规则一样按原文判断是否近似
+    s = get_similar_matcher(comment)
+    users = set()
+    for candidate in find_review_fingerprint_candidates(text_bands(comment), since):
+        if candidate.user_id == user.id or candidate.user_id in users:
+            continue
+        s.set_seq2(candidate.comment)
+        if s.quick_ratio() > SPAM_SIMILAR_RATIO:
+            users.add(candidate.user_id)
+    return len(users) >= SPAM_SIMILAR_USERS
+
+
+def course_rule(data: dict, reviews: list[Review]):
     count = 0
     try:
         course = Course.objects.get(pk=data["course"])
@@ -38,17 +64,24 @@ def course_rule(data: dict, reviews: QuerySet):
     return count == SPAM_MAX_REVIEWS
 
 
+def check_spam_rate(user: User, time: datetime.datetime, limit: int):
+    # 发布点评时同步执行的廉价检查，其余规则由 huey 在发布后异步检查
+    time_threshold = time - datetime.timedelta(minutes=SPAM_PERIOD_MINUTES)
+    return Review.objects.filter(user=user, created_at__gt=time_threshold).count() >= limit
+
+
 def check_spam(user: User, data, time: datetime.datetime):
-    # find review history
+    # find review history, 只看这条点评之前发布的
     time_threshold = time - datetime.timedelta(minutes=SPAM_PERIOD_MINUTES)
-    reviews = Review.objects.select_related("course").filter(user=user, created_at__gt=time_threshold).order_by(
-        "-created_at")[:SPAM_MAX_REVIEWS]
+    reviews = list(Review.objects.select_related("course").filter(
+        user=user, created_at__gt=time_threshold, created_at__lt=time).order_by("-created_at")[:SPAM_MAX_REVIEWS])
 
-    if reviews.count() + 1 < SPAM_MAX_REVIEWS:
-        return False
-    if course_rule(data, reviews):
-        return True
-    if similar_rule(data, reviews):
+    if len(reviews) + 1 >= SPAM_MAX_REVIEWS:
+        if course_rule(data, reviews):
+            return True
+        if similar_rule(data, reviews):
+            return True
+    if similar_users_rule(user, data["comment"], time):
         return True
 
     return False
@@ -60,3 +93,25 @@ def deal_with_spam(user: User, data: dict):
     userprofile.suspended_till = suspended_till
     userprofile.save(update_fields=['suspended_till'])
     send_antispam_email(user.username, data)
+
+
+def hide_spam_review(review: Review):
+    # 删除前保留一份修订记录，便于管理员查看和恢复
+    with transaction.atomic():
+        ReviewRevision.objects.create(review=review, user_id=review.user_id, course_id=review.course_id,
+                                      semester_id=review.semester_id, score=review.score, rating=review.rating,
+                                      comment=review.comment, created_at=utils.common.get_time_now())
+        review.delete()
+
+
+def score_review_spam(review_id: int) -> bool:
+    review = Review.objects.select_related("user").filter(pk=review_id).first()
+    if review is None:
+        return False
+    data = {"course": review.course_id, "semester": review.semester_id, "score": review.score,
+            "comment": review.comment, "rating": review.rating}
+    if not check_spam(review.user, data, review.created_at):
+        return False
+    hide_spam_review(review)
+    deal_with_spam(review.user, data)
+    return True
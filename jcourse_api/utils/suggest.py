@@ -0,0 +1,141 @@
+import bisect
+import threading
+
+from django.core.cache import cache
+from django.db.models import F
+
+from jcourse_api.models import Course
+
+SUGGEST_LIMIT = 10
+
+
+def build_course_suggest_version_cache_key():
+    return "course_suggest_version"
+
+
+class CourseSuggestIndex:
+    """
+    进程内的课程联想索引：按 小写关键词 排序的 (key, course_id) 数组，前缀查找用二分。
+    关键词包括课号、课程名、主讲教师姓名、拼音和拼音缩写。
+    其它进程（导入脚本、别的 worker）修改数据后会更新缓存中的版本号，本进程发现版本不一致时整体重建。
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._entries: list[tuple[str, int]] = []
+        self._keys: dict[int, tuple[str, ...]] = {}
+        self._courses: dict[int, dict] = {}
+        self._version = None
+
+    @staticmethod
+    def _course_keys(course: dict) -> tuple[str, ...]:
+        keys = (course['code'], course['name'], course['teacher'],
+                course['teacher_pinyin'], course['teacher_abbr_pinyin'])
+        return tuple({key.lower() for key in keys if key})
+
+    @staticmethod
+    def _fetch(**filters) -> list[dict]:
+        return list(Course.objects.filter(**filters).values('id', 'code', 'name', teacher=F('main_teacher__name'),
+                                                            teacher_pinyin=F('main_teacher__pinyin'),
+                                                            teacher_abbr_pinyin=F('main_teacher__abbr_pinyin')))
+
+    def _remove(self, course_id: int):
+        for key in self._keys.pop(course_id, ()):
+            index = bisect.bisect_left(self._entries, (key, course_id))
+            if index < len(self._entries) and self._entries[index] == (key, course_id):
+                del self._entries[index]
+        self._courses.pop(course_id, None)
+
+    def _add(self, course: dict):
+        keys = self._course_keys(course)
+        self._keys[course['id']] = keys
+        self._courses[course['id']] = {'id': course['id'], 'code': course['code'], 'name': course['name'],
+                                       'teacher': course['teacher']}
+        for key in keys:
+            bisect.insort(self._entries, (key, course['id']))
+
+    def _current_version(self):
+        version = cache.get(build_course_suggest_version_cache_key())
+        if version is None:
+            version = 0
+            cache.add(build_course_suggest_version_cache_key(), version, None)
+        return version
+
+    def build(self):
+        version = self._current_version()
+        courses = self._fetch()
+        entries = []
+        keys = {}
+        for course in courses:
+            keys[course['id']] = self._course_keys(course)
+            entries.extend((key, course['id']) for key in keys[course['id']])
+        entries.sort()
+        with self._lock:
+            self._entries = entries
+            self._keys = keys
+            self._courses = {course['id']: {'id': course['id'], 'code': course['code'], 'name': course['name'],
+                                            'teacher': course['teacher']} for course in courses}
+            self._version = version
+
+    def reset(self):
+        with self._lock:
+            self._entries, self._keys, self._courses, self._version = [], {}, {}, None
+
+    def refresh(self, course_ids):
+        # 增量更新若干课程，同时通知其它进程重建
+        version = bump_course_suggest_version()
+        with self._lock:
+            # 本地索引未建立，或期间其它进程也有修改，则等下次查询时重建
+            if self._version is None or version != self._version + 1:
+                self._version = None
+                return
+            for course_id in course_ids:
+                self._remove(course_id)
+            for course in self._fetch(id__in=course_ids):
+                self._add(course)
+            self._version = version
+
+    def suggest(self, q: str, limit: int = SUGGEST_LIMIT) -> list[dict]:
+        if self._version is None or self._version != self._current_version():
+            self.build()
+        q = q.strip().lower()
+        if q == '':
+            return []
+        result = []
+        seen = set()
+        with self._lock:
+            index = bisect.bisect_left(self._entries, (q,))
+            while index < len(self._entries) and len(result) < limit:
+                key, course_id = self._entries[index]
+                if not key.startswith(q):
+                    break
+                if course_id not in seen:
+                    seen.add(course_id)
+                    result.append(self._courses[course_id])
+                index += 1
+        return result
+
+
+def bump_course_suggest_version():
+    key = build_course_suggest_version_cache_key()
+    try:
+        return cache.incr(key)
+    except ValueError:
+        cache.add(key, 1, None)
+        return cache.get(key)
+
+
+course_suggest_index = CourseSuggestIndex()
+
+
+def suggest_courses(q: str, limit: int = SUGGEST_LIMIT) -> list[dict]:
+    return course_suggest_index.suggest(q, limit)
+
+
+def refresh_course_suggest(course_ids):
+    course_suggest_index.refresh(list(course_ids))
+
+
+def invalidate_course_suggest():
+    # 批量导入等不触发信号的场景，直接让所有进程下次查询时重建
+    bump_course_suggest_version()
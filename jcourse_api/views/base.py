@@ -1,4 +1,3 @@
-from django.db.models import F
 from django.utils.decorators import method_decorator
 from django.views.decorators.cache import cache_page
 from rest_framework import viewsets, status
@@ -7,8 +6,9 @@ from rest_framework.response import Response
 from rest_framework.views import APIView
 
 from jcourse_api.models import *
-from jcourse_api.repository import get_semesters
-from jcourse_api.serializers import SemesterSerializer, CategorySerializer, DepartmentSerializer
+from jcourse_api.repository import get_semesters, get_review_filter, get_course_filter, get_filtered_course_filter
+from jcourse_api.serializers import SemesterSerializer
+from jcourse_api.views.course import CourseFilter, COURSE_LIST_FILTER_PARAMS, filter_course_list
 
 
 class SemesterViewSet(viewsets.ReadOnlyModelViewSet):
@@ -24,25 +24,26 @@ class SemesterViewSet(viewsets.ReadOnlyModelViewSet):
 class CourseFilterView(APIView):
 
     def get(self, request: Request):
-        categories = Category.objects.annotate(count=Count('course')).filter(count__gt=0)
-        category_serializer = CategorySerializer(categories, many=True)
-        departments = Department.objects.annotate(count=Count('course')).filter(count__gt=0)
-        department_serializer = DepartmentSerializer(departments, many=True)
-        return Response({'categories': category_serializer.data, 'departments': department_serializer.data},
-                        status=status.HTTP_200_OK)
+        """
+        带上课程列表的筛选条件时，返回满足条件的课程的计数
+        """
+        params = [*CourseFilter.base_filters, *COURSE_LIST_FILTER_PARAMS]
+        if not any(param in request.query_params for param in params):
+            return Response(get_course_filter(), status=status.HTTP_200_OK)
+        courses = filter_course_list(Course.objects.all(), request)
+        filterset = CourseFilter(request.query_params, queryset=courses)
+        if not filterset.is_valid():
+            return Response(filterset.errors, status=status.HTTP_400_BAD_REQUEST)
+        return Response(get_filtered_course_filter(filterset.qs), status=status.HTTP_200_OK)
 
 
 class ReviewFilterView(APIView):
 
     def get(self, request: Request):
         course_id = request.query_params.get('course_id')
-        reviews = Review.objects.select_related("semester")
         if course_id:
-            reviews = reviews.filter(course__id=course_id)
-        semesters = reviews.values('semester') \
-            .annotate(count=Count('semester'), name=F("semester__name"), id=F("semester__id"), avg=Avg('rating')) \
-            .filter(count__gt=0).values("id", "name", "count", "avg").order_by(F('name').desc())
-        ratings = reviews.values('rating').annotate(count=Count('rating')).filter(count__gt=0).order_by(
-            F('rating').desc())
-        return Response({'semesters': semesters, 'ratings': ratings},
-                        status=status.HTTP_200_OK)
+            try:
+                course_id = int(course_id)
+            except ValueError:
+                return Response({'detail': '参数错误！'}, status=status.HTTP_400_BAD_REQUEST)
+        return Response(get_review_filter(course_id or None), status=status.HTTP_200_OK)
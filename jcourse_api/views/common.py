@@ -1,3 +1,9 @@
+import hashlib
+import json
+
+from django.core.cache import cache
+from django.utils.http import parse_etags, quote_etag
+from rest_framework import status
 from rest_framework.decorators import api_view
 from rest_framework.response import Response
 
@@ -7,20 +13,39 @@ from jcourse_api.repository import *
 from jcourse_api.serializers import *
 
 
+def get_public_common_info() -> dict:
+    # 所有用户相同的部分，按版本号缓存
+    key = build_common_info_cache_key(get_common_info_version())
+    common_info = cache.get(key)
+    if common_info is None:
+        common_info = {"announcements": AnnouncementSerializer(get_announcements(), many=True).data,
+                       "semesters": SemesterSerializer(get_semesters(), many=True).data,
+                       "promotions": PromotionSerializer(get_promotions(), many=True).data}
+        cache.set(key, common_info, COMMON_INFO_CACHE_TIMEOUT)
+    return common_info
+
+
+def build_etag(data: dict) -> str:
+    content = json.dumps(data, sort_keys=True, ensure_ascii=False, separators=(',', ':'), default=str)
+    return quote_etag(hashlib.sha1(content.encode('utf-8')).hexdigest())
+
+
 # one request for all common info (announcements, semesters, enrolled courses, reviewed courses, user, promotions)
 @api_view(['GET'])
 def get_common_info(request):
     user = request.user
-    announcements = get_announcements()
-    semesters = get_semesters()
-    enrolled_courses = get_enrolled_courses(user)
-    my_reviews = get_my_reviewed(user)
-    promotions = get_promotions()
-
-    return Response({"user": UserSerializer(user).data,
-                     "announcements": AnnouncementSerializer(announcements, many=True).data,
-                     "semesters": SemesterSerializer(semesters, many=True).data,
-                     "enrolled_courses": enrolled_courses,
-                     "my_reviews": my_reviews,
-                     "promotions": PromotionSerializer(promotions, many=True).data
-                     })
+    public_common_info = get_public_common_info()
+    user_common_info = get_user_common_info(user)
+
+    data = {"user": UserSerializer(user).data,
+            "announcements": public_common_info["announcements"],
+            "semesters": public_common_info["semesters"],
+            "enrolled_courses": user_common_info["enrolled_courses"],
+            "my_reviews": user_common_info["my_reviews"],
+            "promotions": public_common_info["promotions"]
+            }
+    etag = build_etag(data)
+    headers = {'ETag': etag, 'Cache-Control': 'private, no-cache'}
+    if etag in parse_etags(request.headers.get('If-None-Match', '')):
+        return Response(status=status.HTTP_304_NOT_MODIFIED, headers=headers)
+    return Response(data, headers=headers)
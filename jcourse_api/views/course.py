@@ -6,10 +6,13 @@ from rest_framework import viewsets, status, mixins
 from rest_framework.decorators import action
 from rest_framework.request import Request
 from rest_framework.response import Response
+from rest_framework.views import APIView
 
 from jcourse_api.models import *
-from jcourse_api.repository import get_course_list_queryset, get_search_course_queryset
+from jcourse_api.repository import get_course_list_queryset, get_search_course_queryset, \
+    get_notification_level_course_filter, get_course_detail_queryset
 from jcourse_api.serializers import CourseListSerializer, CourseSerializer, CourseInWriteReviewSerializer
+from jcourse_api.utils import suggest_courses
 
 
 class NumberInFilter(BaseInFilter, NumberFilter):
@@ -25,21 +28,33 @@ class CourseFilter(django_filters.FilterSet):
         fields = ['categories', 'department']
 
 
+# CourseFilter 之外的课程列表筛选参数
+COURSE_LIST_FILTER_PARAMS = ('notification_level', 'onlyhasreviews')
+
+
+def filter_course_list(courses, request: Request):
+    # 课程列表和筛选项计数共用
+    if 'notification_level' in request.query_params:
+        notification_level = int(request.query_params['notification_level'])
+        condition = get_notification_level_course_filter(request.user, notification_level, 'id')
+        if condition is None:
+            return courses.none()
+        courses = courses.filter(condition)
+    if 'onlyhasreviews' in request.query_params:
+        courses = courses.filter(review_count__gt=0)
+    return courses
+
+
 class CourseViewSet(viewsets.ReadOnlyModelViewSet):
     filter_backends = [DjangoFilterBackend]
     filterset_class = CourseFilter
 
     def get_queryset(self):
-        courses = get_course_list_queryset(self.request.user)
-        if 'notification_level' in self.request.query_params:
-            notification_level = int(self.request.query_params['notification_level'])
-            filtered_course_ids = CourseNotificationLevel.objects.filter(user=self.request.user,
-                                                                         notification_level=notification_level) \
-                .order_by('modified_at').values('course_id')
-            courses = courses.filter(id__in=filtered_course_ids)
+        if self.action == 'retrieve':
+            return get_course_detail_queryset(self.request.user)
+        courses = filter_course_list(get_course_list_queryset(self.request.user), self.request)
         if 'onlyhasreviews' in self.request.query_params:
-            courses = courses.filter(review_count__gt=0). \
-                annotate(count=F('review_count'), avg=F('review_avg'))
+            courses = courses.annotate(count=F('review_count'), avg=F('review_avg'))
             if self.request.query_params['onlyhasreviews'] == 'count':
                 return courses.order_by(F('count').desc(nulls_last=True), F('avg').desc(nulls_last=True), "id")
             return courses.order_by(F('avg').desc(nulls_last=True), F('count').desc(nulls_last=True), "id")
@@ -89,3 +104,11 @@ class CourseInReviewViewSet(viewsets.ReadOnlyModelViewSet):
             return get_search_course_queryset(q, self.request.user)
         elif self.action == 'retrieve':
             return get_course_list_queryset(self.request.user)
+
+
+class CourseSuggestView(APIView):
+
+    def get(self, request: Request):
+        # 写点评时的输入联想，只查进程内索引
+        q = request.query_params.get('q', '')
+        return Response(suggest_courses(q), status=status.HTTP_200_OK)
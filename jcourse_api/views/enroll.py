@@ -4,7 +4,8 @@ from rest_framework.request import Request
 from rest_framework.response import Response
 
 from jcourse_api.models import *
-from jcourse_api.repository import get_course_list_queryset
+from jcourse_api.repository import get_course_list_queryset, get_former_code_map, get_course_code_aliases, \
+    invalidate_user_common_info
 from jcourse_api.serializers import CourseListSerializer
 from oauth.utils import jaccount
 
@@ -18,11 +19,31 @@ def parse_jaccount_courses(response: dict):
     return codes, teachers
 
 
+def match_lessons(lessons: list[tuple[str, str]]) -> list[dict]:
+    """
+    按 (课号, 主讲教师) 匹配课程，优先精确匹配课号，没有时才使用旧课号对应的当前课号。
+    一次查询取出课号和教师都在集合中的课程，再按组合逐条匹配，返回每条课表记录的匹配结果。
+    """
+    former_codes = get_former_code_map()
+    aliases = [get_course_code_aliases(code, former_codes) for code, _ in lessons]
+    codes = {code for codes in aliases for code in codes}
+    teachers = {teacher for _, teacher in lessons}
+    courses = {}
+    for course_id, code, teacher in Course.objects.filter(code__in=codes, main_teacher__name__in=teachers) \
+            .order_by('id').values_list('id', 'code', 'main_teacher__name'):
+        courses.setdefault((code, teacher), []).append(course_id)
+    return [{'code': code, 'teacher': teacher,
+             'course_ids': next((courses[(alias, teacher)] for alias in lesson_codes if (alias, teacher) in courses),
+                                [])}
+            for (code, teacher), lesson_codes in zip(lessons, aliases)]
+
+
+def get_matched_course_ids(matches: list[dict]) -> list[int]:
+    return list(dict.fromkeys(course_id for match in matches for course_id in match['course_ids']))
+
+
 def find_exist_course_ids(codes: list, teachers: list):
-    conditions = Q(pk=None)
-    for code, teacher in zip(codes, teachers):
-        conditions = conditions | (Q(code=code) & Q(main_teacher__name=teacher))
-    return Course.objects.filter(conditions).values_list('id', flat=True)
+    return get_matched_course_ids(match_lessons(list(zip(codes, teachers))))
 
 
 def sync_enroll_course(user: User, course_ids: list, term: str):
@@ -30,12 +51,21 @@ def sync_enroll_course(user: User, course_ids: list, term: str):
         semester = Semester.objects.get(name=term)
     except Semester.DoesNotExist:
         semester = None
-    enroll_courses = []
-    for course_id in course_ids:
-        enroll_courses.append(EnrollCourse(user=user, course_id=course_id, semester=semester))
+    course_ids = set(course_ids)
+    enrolled = EnrollCourse.objects.filter(user=user, semester=semester)
+    enrolled_ids = set(enrolled.values_list('course_id', flat=True))
+    withdrawn_ids = enrolled_ids - course_ids
+    new_ids = course_ids - enrolled_ids
+    if not withdrawn_ids and not new_ids:
+        return
     # remove withdrawn courses
-    EnrollCourse.objects.filter(user=user, semester=semester).exclude(course_id__in=course_ids).delete()
-    EnrollCourse.objects.bulk_create(enroll_courses, ignore_conflicts=True)
+    if withdrawn_ids:
+        enrolled.filter(course_id__in=withdrawn_ids).delete()
+    if new_ids:
+        EnrollCourse.objects.bulk_create([EnrollCourse(user=user, course_id=course_id, semester=semester)
+                                          for course_id in new_ids], ignore_conflicts=True)
+    # bulk_create 不触发信号
+    invalidate_user_common_info(user.id)
 
 
 def get_jaccount_lessons(token: dict, term: str):
@@ -59,13 +89,12 @@ def sync_lessons(request: Request, term: str = '2018-2019-2'):
     return Response(serializer.data)
 
 
-def find_existing_course_v2(data: dict):
-    codes = [item["code"] for item in data]
-    conditions = Q(pk=None)
-    for item in data:
-        teacher = item["teachers"].split(",")[0]
-        conditions = conditions | (Q(code=item["code"]) & Q(main_teacher__name=teacher))
-    return Course.objects.filter(conditions).values_list('id', flat=True)
+def match_lessons_v2(data: list[dict]) -> list[dict]:
+    return match_lessons([(item["code"], item["teachers"].split(",")[0]) for item in data])
+
+
+def find_existing_course_v2(data: list[dict]):
+    return get_matched_course_ids(match_lessons_v2(data))
 
 
 @api_view(['POST'])
@@ -73,9 +102,9 @@ def sync_lessons_v2(request: Request):
     if len(request.data) == 0:
         return Response({'detail': '至少需要提交一条课表信息'}, status=status.HTTP_400_BAD_REQUEST)
     semester = request.data[0]["semester"]
-    existed_courses_ids = find_existing_course_v2(request.data)
-    sync_enroll_course(request.user, existed_courses_ids, semester)
-    return Response({'detail': 'ok'})
+    matches = match_lessons_v2(request.data)
+    sync_enroll_course(request.user, get_matched_course_ids(matches), semester)
+    return Response({'detail': 'ok', 'lessons': matches})
 
 
 class EnrollCourseViewSet(viewsets.ReadOnlyModelViewSet):
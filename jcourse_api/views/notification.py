@@ -4,6 +4,7 @@ from rest_framework.request import Request
 from rest_framework.response import Response
 
 from jcourse_api.models import *
+from jcourse_api.repository import get_unread_notification_count, invalidate_unread_notification_count
 from jcourse_api.serializers import NotificationSerializer
 
 
@@ -24,8 +25,38 @@ class NotificationViewSet(viewsets.ReadOnlyModelViewSet):
             notification.read_at = timezone.now()
         else:
             notification.read_at = None
-        notification.save()
+        notification.save(update_fields=['read_at'])
 
         return Response({'id': pk,
                          'read_at': notification.read_at},
                         status=status.HTTP_200_OK)
+
+    @action(detail=False, methods=['GET'], url_path='unread-count')
+    def unread_count(self, request: Request):
+        return Response({'count': get_unread_notification_count(request.user)}, status=status.HTTP_200_OK)
+
+    @action(detail=False, methods=['POST'], url_path='bulk-read')
+    def bulk_read(self, request: Request):
+        """
+        批量设为已读或未读，不指定 ids 时操作全部通知
+        """
+        if 'read' not in request.data:
+            return Response({'error': '未指定操作类型！'}, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            read = int(request.data['read'])
+        except (TypeError, ValueError):
+            return Response({'error': '参数错误！'}, status=status.HTTP_400_BAD_REQUEST)
+        notifications = self.get_queryset()
+        ids = request.data.get('ids')
+        if ids is not None:
+            if not isinstance(ids, list) or not all(isinstance(i, int) for i in ids):
+                return Response({'error': '参数错误！'}, status=status.HTTP_400_BAD_REQUEST)
+            notifications = notifications.filter(id__in=ids)
+        if read:
+            count = notifications.filter(read_at__isnull=True).update(read_at=timezone.now())
+        else:
+            count = notifications.filter(read_at__isnull=False).update(read_at=None)
+        # update() 不触发信号
+        invalidate_unread_notification_count([request.user.id])
+        return Response({'count': count, 'unread': get_unread_notification_count(request.user)},
+                        status=status.HTTP_200_OK)
@@ -1,5 +1,6 @@
 from django.db import transaction
-from django.db.models import F
+from django.db.models import F, Value
+from django.db.models.functions import Coalesce
 from rest_framework import viewsets, serializers, status
 from rest_framework.decorators import action
 from rest_framework.exceptions import ValidationError
@@ -10,16 +11,19 @@ from rest_framework.response import Response
 from rest_framework.throttling import UserRateThrottle
 
 from jcourse import settings
+from jcourse.paginations import KeysetPagination
 from jcourse.throttles import ReactionRateThrottle
 from jcourse_api.models import *
 from jcourse_api.permissions import IsAdminOrReadOnly, IsOwnerOrAdminOrReadOnly
-from jcourse_api.repository import get_reviews
+from jcourse_api.repository import get_reviews, get_search_review_queryset, get_notification_level_course_filter
 from jcourse_api.serializers import ReviewRevisionSerializer, CreateReviewSerializer, ReviewItemSerializer, \
     ReviewListSerializer, ReviewInCourseSerializer
-from jcourse_api.utils import check_spam, deal_with_spam
+from jcourse_api.tasks import check_review_spam
+from jcourse_api.utils import check_spam_rate
 
 
 class ReviewViewSet(viewsets.ModelViewSet):
+    pagination_class = KeysetPagination
 
     def get_permissions(self):
         if settings.REVIEW_READ_ONLY:
@@ -30,23 +34,38 @@ class ReviewViewSet(viewsets.ModelViewSet):
             return [IsOwnerOrAdminOrReadOnly()]
 
     def get_queryset(self):
+        if self.action == 'reaction':
+            # 只需确认点评存在
+            return Review.objects.only('id')
         reviews = get_reviews(self.request.user)
         if 'notification_level' in self.request.query_params:
             notification_level = int(self.request.query_params['notification_level'])
-            filtered_course_ids = CourseNotificationLevel.objects.filter(user=self.request.user,
-                                                                         notification_level=notification_level) \
-                .values('course_id')
-            reviews = reviews.filter(course_id__in=filtered_course_ids)
+            if notification_level not in CourseNotificationLevel.NotificationLevelType or \
+                    not self.request.user.is_authenticated:
+                return reviews.none()
+            condition = get_notification_level_course_filter(self.request.user, notification_level)
+            if condition is None:
+                return reviews.none()
+            reviews = reviews.filter(condition)
         elif self.request.user.is_authenticated:
-            ignored_course_ids = CourseNotificationLevel.objects.filter(user=self.request.user,
-                                                                        notification_level=CourseNotificationLevel.NotificationLevelType.IGNORE) \
-                    .values('course_id')
-            reviews = reviews.exclude(course_id__in=ignored_course_ids)
+            condition = get_notification_level_course_filter(self.request.user,
+                                                             CourseNotificationLevel.NotificationLevelType.IGNORE)
+            # 没有忽略的课程时不加任何条件
+            if condition is not None:
+                reviews = reviews.exclude(condition)
         if 'order' in self.request.query_params:
             if self.request.query_params['order'] == 'approves':
                 return reviews.order_by(F('approve_count').desc(nulls_last=True), F('created_at').desc(nulls_last=True))
         return reviews
 
+    def get_keyset_ordering(self):
+        # 只有列表支持 cursor 翻页，排序键与 Review 上的表达式索引一致
+        if self.action != 'list':
+            return None
+        if self.request.query_params.get('order') == 'approves':
+            return [('keyset_approves', Coalesce('approve_count', Value(0))), ('keyset_created_at', F('created_at'))]
+        return [('keyset_modified_at', Coalesce('modified_at', 'created_at'))]
+
     def get_serializer_class(self):
         if self.action == 'create' or self.action == 'update':
             return CreateReviewSerializer
@@ -57,10 +76,12 @@ class ReviewViewSet(viewsets.ModelViewSet):
 
     def perform_create(self, serializer: serializers.ModelSerializer):
         created_time = timezone.now()
-        if check_spam(self.request.user, serializer.initial_data, created_time):
-            deal_with_spam(self.request.user, serializer.initial_data)
-            raise ValidationError({'error': "由于大量刷点评，您已被封号，如有疑问请邮件联系"})
-        serializer.save(user=self.request.user, modified_at=created_time, created_at=created_time)
+        if settings.REVIEW_RATE_LIMIT and check_spam_rate(self.request.user, created_time, settings.REVIEW_RATE_LIMIT):
+            raise ValidationError({'error': "发布点评过于频繁，请稍后再试"})
+        review = serializer.save(user=self.request.user, modified_at=created_time, created_at=created_time)
+        # 内容相似等较慢的检查在发布后异步进行，命中时删除点评并封号，通过后才通知关注者
+        review_id = review.id
+        transaction.on_commit(lambda: check_review_spam(review_id))
 
     def perform_update(self, serializer: serializers.ModelSerializer):
         modified_time = timezone.now()
@@ -77,14 +98,22 @@ class ReviewViewSet(viewsets.ModelViewSet):
     def reaction(self, request: Request, pk=None):
         if 'reaction' not in request.data:
             return Response({'error': '未指定操作类型！'}, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            reaction = int(request.data.get('reaction'))
+        except (TypeError, ValueError):
+            reaction = None
+        if reaction not in ReviewReaction.ReactionType:
+            return Response({'error': '无效的操作类型！'}, status=status.HTTP_400_BAD_REQUEST)
         review: Review = self.get_object()
-        ReviewReaction.objects.update_or_create(user=request.user, review=review,
-                                                defaults={'reaction': request.data.get('reaction')})
-        review.refresh_from_db()
+        with transaction.atomic():
+            # update_or_create 会锁住该用户的回应记录，计数在 ReviewReaction.save 中用 F() 增减
+            ReviewReaction.objects.update_or_create(user=request.user, review=review,
+                                                    defaults={'reaction': reaction})
+            counts = Review.objects.filter(pk=review.pk).values('approve_count', 'disapprove_count').get()
         return Response({'id': pk,
                          'reaction': request.data.get('reaction'),
-                         'approves': review.approve_count,
-                         'disapproves': review.disapprove_count},
+                         'approves': counts['approve_count'],
+                         'disapproves': counts['disapprove_count']},
                         status=status.HTTP_200_OK)
 
     @action(detail=False, methods=['GET'])
@@ -94,6 +123,14 @@ class ReviewViewSet(viewsets.ModelViewSet):
         data = serializer(reviews, many=True, context={'request': request}).data
         return Response(data)
 
+    @action(detail=False, methods=['GET'])
+    def search(self, request: Request):
+        q = request.query_params.get('q', '')
+        reviews = get_search_review_queryset(q, request.user)
+        page = self.paginate_queryset(reviews)
+        serializer = self.get_serializer(page, many=True)
+        return self.get_paginated_response(serializer.data)
+
     @action(detail=True, methods=['GET'])
     def location(self, request, pk):
         review: Review = self.get_object()
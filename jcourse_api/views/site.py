@@ -1,6 +1,7 @@
-from django.contrib.auth.models import User
+from collections import Counter
+
 from django.db.models import Count, F
-from django.db.models.functions import TruncDate, Floor
+from django.db.models.functions import Floor
 from django.utils.decorators import method_decorator
 from django.views.decorators.cache import cache_page
 from rest_framework import viewsets, status
@@ -10,8 +11,8 @@ from rest_framework.request import Request
 from rest_framework.response import Response
 from rest_framework.views import APIView
 
-from jcourse_api.models import Review, Course
-from jcourse_api.repository import get_announcements
+from jcourse_api.models import Course
+from jcourse_api.repository import get_announcements, get_daily_statistics
 from jcourse_api.serializers import AnnouncementSerializer
 
 
@@ -25,20 +26,25 @@ class StatisticView(APIView):
 
     @method_decorator(cache_page(60))
     def get(self, request: Request):
-        user_join_time = User.objects.values(date=TruncDate("date_joined")).annotate(
-            count=Count("id")).order_by("date")
-        review_create_time = Review.objects.values(date=TruncDate("created_at")).annotate(
-            count=Count("id")).order_by("date")
-        course_review_count_dist = Course.objects.filter(review_count__gt=0).values(value=F("review_count")).annotate(
+        statistics = get_daily_statistics()
+        user_join_time = [{'date': statistic.date, 'count': statistic.user_count}
+                          for statistic in statistics if statistic.user_count > 0]
+        review_create_time = [{'date': statistic.date, 'count': statistic.review_count}
+                              for statistic in statistics if statistic.review_count > 0]
+        rating_counts = Counter()
+        for statistic in statistics:
+            rating_counts.update({int(rating): count for rating, count in statistic.review_rating_counts.items()})
+        review_rating_dist = [{'value': rating, 'count': count} for rating, count in sorted(rating_counts.items())]
+        # 课程表较小，仍然实时统计
+        courses = Course.objects.filter(review_count__gt=0)
+        course_review_count_dist = courses.values(value=F("review_count")).annotate(
             count=Count("value")).order_by("value")
         course_review_avg_dist = Course.objects.filter(review_avg__gt=0).values(value=Floor("review_avg")).annotate(
             count=Count("value")).order_by("value")
-        review_rating_dist = Review.objects.values(value=F("rating")).annotate(
-            count=Count("value")).order_by("value")
         return Response({'course_count': Course.objects.count(),
-                         'course_with_review_count': Course.objects.filter(review_count__gt=0).count(),
-                         'user_count': User.objects.count(),
-                         'review_count': Review.objects.count(),
+                         'course_with_review_count': courses.count(),
+                         'user_count': sum(statistic.user_count for statistic in statistics),
+                         'review_count': sum(statistic.review_count for statistic in statistics),
                          'user_join_time': user_join_time,
                          'review_create_time': review_create_time,
                          'course_review_count_dist': course_review_count_dist,
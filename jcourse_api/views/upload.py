@@ -8,7 +8,9 @@ from rest_framework.permissions import IsAdminUser
 from rest_framework.response import Response
 from rest_framework.views import APIView
 
+from jcourse_api.repository import invalidate_course_related, invalidate_course_filter
 from jcourse_api.serializers import *
+from jcourse_api.utils import invalidate_course_suggest
 from utils.course_data_clean import UploadData
 
 
@@ -97,6 +99,10 @@ def import_dependent_data(data, semester: str):
 
     Course.categories.through.objects.bulk_create(categories, ignore_conflicts=True)
     Course.teacher_group.through.objects.bulk_create(teacher_group, ignore_conflicts=True)
+    # bulk_create 不触发信号
+    invalidate_course_suggest()
+    invalidate_course_related()
+    invalidate_course_filter()
 
     return created_courses, created_teachers
 
@@ -1,8 +1,6 @@
+from django.core.cache import cache
 from django.db.models import Sum
-from django.utils.decorators import method_decorator
-from django.views.decorators.cache import cache_page
 from django.views.decorators.csrf import csrf_exempt
-from django.views.decorators.vary import vary_on_cookie
 from rest_framework import mixins, viewsets, status
 from rest_framework.permissions import AllowAny
 from rest_framework.request import Request
@@ -10,6 +8,7 @@ from rest_framework.response import Response
 from rest_framework.views import APIView
 
 from jcourse_api.models import *
+from jcourse_api.repository import build_user_point_cache_key, get_user_points_by_ids, USER_POINT_CACHE_TIMEOUT
 from jcourse_api.serializers import ReportSerializer, UserSerializer, UserPointSerializer
 from jcourse_api.tasks import send_report_email
 from oauth.utils import hash_username
@@ -41,12 +40,22 @@ class UserView(APIView):
 
 
 def get_user_point(user: User):
-    user_points = UserPoint.objects.filter(user=user)
-    points = user_points.aggregate(sum=Sum('value'))['sum']
-    if points is None:
-        points = 0
-    details = UserPointSerializer(user_points, many=True).data
-    return {'points': points, 'details': details}
+    key = build_user_point_cache_key(user.id)
+    user_point = cache.get(key)
+    if user_point is None:
+        user_points = UserPoint.objects.filter(user=user)
+        points = user_points.aggregate(sum=Sum('value'))['sum']
+        if points is None:
+            points = 0
+        details = UserPointSerializer(user_points, many=True).data
+        user_point = {'points': points, 'details': details}
+        cache.set(key, user_point, USER_POINT_CACHE_TIMEOUT)
+    return user_point
+
+
+def check_api_key(request: Request) -> bool:
+    apikey = request.headers.get('Api-Key', '')
+    return apikey != '' and ApiKey.objects.filter(key=apikey, is_enabled=True).exists()
 
 
 class UserPointView(APIView):
@@ -57,23 +66,39 @@ class UserPointView(APIView):
         else:
             return super().get_permissions()
 
-    @method_decorator(cache_page(60))
-    @method_decorator(vary_on_cookie)
     def get(self, request: Request):
         return Response(get_user_point(request.user))
 
     @csrf_exempt
     def post(self, request: Request):
         account = request.data.get('account', '')
-        apikey = request.headers.get('Api-Key', '')
-        if account == '' or apikey == '':
-            return Response({'detail': 'Bad arguments'}, status=status.HTTP_400_BAD_REQUEST)
-        try:
-            ApiKey.objects.get(key=apikey, is_enabled=True)
-        except ApiKey.DoesNotExist:
+        if account == '' or not check_api_key(request):
             return Response({'detail': 'Bad arguments'}, status=status.HTTP_400_BAD_REQUEST)
         try:
             user = User.objects.get(username=hash_username(account), is_active=True)
         except User.DoesNotExist:
             return Response({'detail': 'Bad arguments'}, status=status.HTTP_400_BAD_REQUEST)
         return Response(get_user_point(user))
+
+
+# 单次批量查询的账号数上限
+USER_POINT_BATCH_LIMIT = 100
+
+
+class UserPointBatchView(APIView):
+    permission_classes = [AllowAny]
+
+    @csrf_exempt
+    def post(self, request: Request):
+        """
+        合作方按账号批量查询积分，未找到的账号不出现在结果中
+        """
+        accounts = request.data.get('accounts')
+        if not isinstance(accounts, list) or not 0 < len(accounts) <= USER_POINT_BATCH_LIMIT \
+                or not all(isinstance(account, str) and account != '' for account in accounts) \
+                or not check_api_key(request):
+            return Response({'detail': 'Bad arguments'}, status=status.HTTP_400_BAD_REQUEST)
+        usernames = {hash_username(account): account for account in accounts}
+        users = dict(User.objects.filter(username__in=usernames, is_active=True).values_list('id', 'username'))
+        points = get_user_points_by_ids(list(users))
+        return Response({'points': {usernames[username]: points[user_id] for user_id, username in users.items()}})
@@ -1,6 +1,65 @@
+import atexit
+import threading
+
+from django.core.cache import cache
+from django.db import connections
 from django.http import HttpRequest
 
 from oauth.tasks import update_last_seen_at
+from utils.common import get_time_now
+
+# 同一用户在该时间内只记录一次活跃时间
+LAST_SEEN_AT_INTERVAL = 5 * 60
+# 本进程攒够这么多用户或第一条记录之后超过这么久时批量写入
+LAST_SEEN_AT_FLUSH_SIZE = 500
+LAST_SEEN_AT_FLUSH_INTERVAL = 60
+
+
+def build_last_seen_at_cache_key(user_id: int):
+    return f"last_seen_at_{user_id}"
+
+
+class LastSeenAtBuffer:
+    """
+    进程内暂存用户的活跃时间，攒够 LAST_SEEN_AT_FLUSH_SIZE 个用户时立即写入，
+    否则在第一条记录之后 LAST_SEEN_AT_FLUSH_INTERVAL 秒由定时器写入，进程退出时也会写入。
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._pending = {}
+        self._timer = None
+
+    def add(self, user_id: int):
+        with self._lock:
+            self._pending[user_id] = get_time_now()
+            if len(self._pending) < LAST_SEEN_AT_FLUSH_SIZE:
+                if self._timer is None:
+                    self._timer = threading.Timer(LAST_SEEN_AT_FLUSH_INTERVAL, self._flush_on_timer)
+                    self._timer.daemon = True
+                    self._timer.start()
+                return
+        self.flush()
+
+    def _flush_on_timer(self):
+        try:
+            self.flush()
+        finally:
+            # 定时器线程中打开的数据库连接不会被请求结束时的逻辑关闭
+            connections.close_all()
+
+    def flush(self):
+        with self._lock:
+            pending, self._pending = self._pending, {}
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
+        if pending:
+            update_last_seen_at(pending)
+
+
+last_seen_at_buffer = LastSeenAtBuffer()
+atexit.register(last_seen_at_buffer.flush)
 
 
 class LastSeenAtMiddleware:
@@ -9,7 +68,8 @@ class LastSeenAtMiddleware:
         # One-time configuration and initialization.
 
     def __call__(self, request: HttpRequest):
-        if request.user.is_authenticated:
-            update_last_seen_at(request.user)
+        if request.user.is_authenticated and \
+                cache.add(build_last_seen_at_cache_key(request.user.id), True, LAST_SEEN_AT_INTERVAL):
+            last_seen_at_buffer.add(request.user.id)
         response = self.get_response(request)
         return response
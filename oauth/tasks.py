@@ -1,4 +1,7 @@
+from datetime import datetime
+
 from django.contrib.auth.models import User
+from django.db.models import Case, When, Value, DateTimeField
 from huey import crontab
 from huey.contrib.djhuey import db_periodic_task, task
 
@@ -16,7 +19,14 @@ def release_banned_users():
 
 
 @task()
-def update_last_seen_at(user: User):
-    profile, _ = UserProfile.objects.get_or_create(user=user)
-    profile.last_seen_at = get_time_now()
-    profile.save()
+def update_last_seen_at(last_seen_at: dict[int, datetime]):
+    # 只更新 last_seen_at 一列，不经过 UserProfile.save，也就不会重写 User.is_active
+    existing = set(UserProfile.objects.filter(user_id__in=last_seen_at).values_list('user_id', flat=True))
+    if existing:
+        UserProfile.objects.filter(user_id__in=existing).update(last_seen_at=Case(
+            *[When(user_id=user_id, then=Value(last_seen_at[user_id])) for user_id in existing],
+            output_field=DateTimeField()))
+    # 排队期间可能被删除的用户不再创建
+    missing = User.objects.filter(id__in=set(last_seen_at) - existing).values_list('id', flat=True)
+    UserProfile.objects.bulk_create([UserProfile(user_id=user_id, last_seen_at=last_seen_at[user_id])
+                                     for user_id in missing], ignore_conflicts=True)
@@ -6,7 +6,9 @@ from django.core.cache import cache
 from django.test import TestCase
 from rest_framework.test import APIClient
 
+from oauth.middlewares import build_last_seen_at_cache_key, last_seen_at_buffer
 from oauth.models import UserProfile
+from oauth.tasks import update_last_seen_at
 from oauth.utils import hash_username, get_or_create_user, auth_get_email_code, reset_get_email_code
 from utils.common import get_time_now
 
@@ -276,3 +278,55 @@ class UserProfileTestCase(TestCase):
         self.user.refresh_from_db()
         self.assertEqual(self.user.is_active, True)
 
+
+class LastSeenAtTestCase(TestCase):
+
+    def setUp(self) -> None:
+        self.user = User.objects.create_user(username='test1')
+        self.user2 = User.objects.create_user(username='test2')
+        UserProfile.objects.create(user=self.user2)
+        self.client = APIClient()
+        for user in (self.user, self.user2):
+            self.addCleanup(cache.delete, build_last_seen_at_cache_key(user.id))
+        self.addCleanup(last_seen_at_buffer.flush)
+
+    def test_buffered(self):
+        self.client.force_login(self.user)
+        with patch('oauth.middlewares.update_last_seen_at') as update:
+            # 清掉之前的测试留下的记录
+            last_seen_at_buffer.flush()
+            update.reset_mock()
+            self.client.get('/api/me/')
+            self.client.get('/api/me/')
+            last_seen_at_buffer.flush()
+            update.assert_called_once()
+            self.assertEqual(list(update.call_args.args[0]), [self.user.id])
+            # 间隔内的请求不再记录
+            self.client.get('/api/me/')
+            last_seen_at_buffer.flush()
+            update.assert_called_once()
+
+    def test_flush_on_timer(self):
+        self.client.force_login(self.user)
+        with patch('oauth.middlewares.update_last_seen_at') as update, \
+                patch('oauth.middlewares.LAST_SEEN_AT_FLUSH_INTERVAL', 0.01):
+            last_seen_at_buffer.flush()
+            update.reset_mock()
+            self.client.get('/api/me/')
+            timer = last_seen_at_buffer._timer
+            self.assertIsNotNone(timer)
+            timer.join(1)
+            update.assert_called_once()
+            self.assertEqual(list(update.call_args.args[0]), [self.user.id])
+            self.assertIsNone(last_seen_at_buffer._timer)
+
+    def test_update(self):
+        self.user2.is_active = False
+        self.user2.save()
+        now = get_time_now()
+        update_last_seen_at({self.user.id: now, self.user2.id: now})
+        self.assertEqual(UserProfile.objects.get(user=self.user).last_seen_at, now)
+        self.assertEqual(UserProfile.objects.get(user=self.user2).last_seen_at, now)
+        # 不会改写封禁状态
+        self.user2.refresh_from_db()
+        self.assertFalse(self.user2.is_active)
@@ -2,24 +2,24 @@ import csv
 
 from django.contrib.auth.models import User
 
-from jcourse_api.models import Course, Review, FormerCode, Semester
+from jcourse_api.models import Course, Review, Semester
+from jcourse_api.repository import get_former_code_map, get_course_code_aliases, pick_course_by_code_aliases
 
 f = open('./data/2021_wenjuan.csv', mode='r', encoding='utf-8-sig')
 csv_reader = csv.DictReader(f)
 q = []
 users = User.objects.filter(username__istartswith='工具人')
+former_codes = get_former_code_map()
 for row in csv_reader:
     try:
         code, course_name, teacher = row['课程'].split(' ')
         # print(code, course_name, teahcer)
         try:
-            codes = [code]
-            try:
-                former_code = FormerCode.objects.get(old_code=code).new_code
-                codes.append(former_code)
-            except FormerCode.DoesNotExist:
-                pass
-            course = Course.objects.get(code__in=codes, main_teacher__name=teacher)
+            codes = get_course_code_aliases(code, former_codes)
+            course = pick_course_by_code_aliases(Course.objects.filter(code__in=codes, main_teacher__name=teacher),
+                                                 codes)
+            if course is None:
+                raise Course.DoesNotExist
             has_reviewed = Review.objects.filter(course=course, user__in=users).exists()
             if not has_reviewed:
                 q.append((course, row))
@@ -1,17 +1,63 @@
-import jieba
+import hashlib
+import multiprocessing
+
+from django.conf import settings
+from django.core.cache import cache
 from django.db.models import Func, Value
 
+CUT_WORD_CACHE_TIMEOUT = 7 * 24 * 3600
+
 
 class ToTsVector(Func):
     function = 'to_tsvector'
     template = "%(function)s('english', %(expressions)s)"
 
 
+def get_tokenizer():
+    # 首次分词时才导入 jieba 并加载词典，不分词的进程（多数 web worker、管理命令）不必付出这部分启动时间和内存
+    import jieba
+    if not jieba.dt.initialized:
+        if settings.JIEBA_CACHE_FILE:
+            # 预先生成的词典缓存，所有进程直接读取，不必各自重建
+            jieba.dt.cache_file = settings.JIEBA_CACHE_FILE
+        jieba.dt.initialize()
+    return jieba.dt
+
+
 def cut_word(raw: str):
-    seg_list = jieba.cut_for_search(raw)
+    seg_list = get_tokenizer().cut_for_search(raw)
     segmented_comment = " ".join(seg_list)
     return segmented_comment
 
 
+def build_cut_word_cache_key(raw: str):
+    return f"cut_word_{hashlib.sha1(raw.encode('utf-8')).hexdigest()}"
+
+
+def cut_words(raws: list[str], processes: int = 1) -> list[str]:
+    # 按内容哈希缓存结果，相同内容只分词一次；processes > 1 时未命中的部分由多个进程并行分词
+    keys = {raw: build_cut_word_cache_key(raw) for raw in raws}
+    cached = cache.get_many(keys.values())
+    results = {raw: cached[key] for raw, key in keys.items() if key in cached}
+    missing = [raw for raw in keys if raw not in results]
+    if not missing:
+        return [results[raw] for raw in raws]
+    if processes > 1 and len(missing) > 1:
+        # 先在本进程加载词典，fork 出的子进程直接复用；
+        # 必须显式使用 fork，Python 3.14 起 Linux 默认的 forkserver 会让每个子进程重新加载词典
+        get_tokenizer()
+        with multiprocessing.get_context('fork').Pool(processes) as pool:
+            segmented = pool.map(cut_word, missing, chunksize=max(len(missing) // (processes * 4), 1))
+    else:
+        segmented = [cut_word(raw) for raw in missing]
+    cache.set_many({keys[raw]: value for raw, value in zip(missing, segmented)}, CUT_WORD_CACHE_TIMEOUT)
+    results.update(zip(missing, segmented))
+    return [results[raw] for raw in raws]
+
+
 def get_cut_word_search_vector(raw: str):
-    return ToTsVector(Value(cut_word(raw)))
+    return ToTsVector(Value(cut_words([raw])[0]))
+
+
+def get_cut_words_search_vectors(raws: list[str], processes: int = 1):
+    return [ToTsVector(Value(segmented)) for segmented in cut_words(raws, processes)]
@@ -0,0 +1,50 @@
+import hashlib
+import struct
+
+MINHASH_BANDS = 10
+MINHASH_ROWS = 3
+MINHASH_SIZE = MINHASH_BANDS * MINHASH_ROWS
+# 按相邻两个字符切分，中文不必分词，与 difflib 逐字符比较的口径一致
+SHINGLE_SIZE = 2
+_PRIME = (1 << 61) - 1
+
+
+def stable_hash(value: str) -> int:
+    # 不使用内置 hash，保证不同进程、不同次运行结果一致
+    return int.from_bytes(hashlib.blake2b(value.encode('utf-8'), digest_size=8).digest(), 'big')
+
+
+_PERMUTATIONS = [(stable_hash(f'a{i}') % (_PRIME - 1) + 1, stable_hash(f'b{i}') % _PRIME) for i in range(MINHASH_SIZE)]
+
+
+def normalize(text: str) -> str:
+    # 去掉空白和标点，英文不区分大小写
+    return ''.join(char for char in text.lower() if char.isalnum())
+
+
+def shingles(text: str) -> set[str]:
+    text = normalize(text)
+    if len(text) <= SHINGLE_SIZE:
+        return {text} if text else set()
+    return {text[i:i + SHINGLE_SIZE] for i in range(len(text) - SHINGLE_SIZE + 1)}
+
+
+def minhash(text: str) -> list[int]:
+    values = [stable_hash(shingle) % _PRIME for shingle in shingles(text)]
+    if not values:
+        return [_PRIME] * MINHASH_SIZE
+    return [min((a * value + b) % _PRIME for value in values) for a, b in _PERMUTATIONS]
+
+
+def split_bands(signature: list[int]) -> list[int]:
+    # 每段的几个最小哈希合成一个有符号 32 位整数以便建索引；只改了一两个词的点评几乎总有一段相同
+    bands = []
+    for i in range(MINHASH_BANDS):
+        rows = signature[i * MINHASH_ROWS:(i + 1) * MINHASH_ROWS]
+        digest = hashlib.blake2b(struct.pack(f'>{MINHASH_ROWS}Q', *rows), digest_size=4).digest()
+        bands.append(int.from_bytes(digest, 'big', signed=True))
+    return bands
+
+
+def text_bands(text: str) -> list[int]:
+    return split_bands(minhash(text))